@@ -5,6 +5,7 @@
 
 import argparse
 import asyncio
+import os
 from pathlib import Path
 import sys
 from datetime import datetime
@@ -16,8 +17,53 @@ from open_gopro.models import constants, proto
 from open_gopro.util import add_cli_args_and_parse
 from open_gopro.util.logger import setup_logging
 
+try:
+    import uvloop
+    # uvloop.run only exists from 0.18; older installs (e.g. Debian bookworm's 0.17) use asyncio.run
+    UVLOOP_AVAILABLE = hasattr(uvloop, "run")
+except ImportError:
+    UVLOOP_AVAILABLE = False
+
 console = Console()
 
+# Videos are saved to the 'output' directory, created once by entrypoint()
+OUTPUT_DIR = Path("output")
+# Bytes read from stdin past the last line read_line() returned
+stdin_pending = bytearray()
+
+
+async def read_line() -> str:
+    """Wait for one line on stdin without tying up a worker thread."""
+    if sys.platform == "win32":
+        # Windows event loops can't watch console handles, so fall back to a thread there
+        return await asyncio.to_thread(sys.stdin.readline)
+
+    loop = asyncio.get_running_loop()
+    fd = sys.stdin.fileno()
+    # Read the raw fd and split lines here: sys.stdin.readline() would buffer any extra lines,
+    # and the fd would then never turn readable again for them
+    while (end := stdin_pending.find(b"\n")) < 0:
+        readable = asyncio.Event()
+        try:
+            loop.add_reader(fd, readable.set)
+        except (NotImplementedError, PermissionError):
+            # A regular file can't be watched, but reading it never blocks for long
+            return await asyncio.to_thread(sys.stdin.readline)
+        try:
+            await readable.wait()
+        finally:
+            loop.remove_reader(fd)
+        data = os.read(fd, 4096)
+        if not data:
+            # End of input: hand back whatever is left, as readline() would
+            end = len(stdin_pending) - 1
+            break
+        stdin_pending.extend(data)
+
+    line = stdin_pending[:end + 1].decode(errors="replace")
+    del stdin_pending[:end + 1]
+    return line
+
 
 async def main(args: argparse.Namespace) -> None:
     """The main async event loop.
@@ -30,12 +76,10 @@ async def main(args: argparse.Namespace) -> None:
 
     # Generate a timestamp-based filename
     timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    # Define the output directory as 'output'
-    output_dir = Path("output")
-    # Ensure the output directory exists
-    output_dir.mkdir(parents=True, exist_ok=True)
-    # Construct the full output path (without a suffix)
-    output_path = output_dir / timestamp
+    # Construct the full output paths for the video and its GPMF data
+    output_path = OUTPUT_DIR / timestamp
+    mp4_path = output_path.with_suffix(".mp4")
+    gpmf_path = output_path.with_suffix(".gpmf")
 
     try:
         # Exclusively use WiredGoPro for the connection
@@ -50,8 +94,7 @@ async def main(args: argparse.Namespace) -> None:
             # Wait for the user to start recording
             console.print("\nType 'start' and press Enter to begin recording.", style="bold yellow")
             while True:
-                # Run blocking input in a separate thread to not block asyncio event loop
-                command = await asyncio.to_thread(sys.stdin.readline)
+                command = await read_line()
                 if command.strip().lower() == 'start':
                     break
                 console.print("Invalid command. Please type 'start' to begin.", style="bold red")
@@ -63,7 +106,7 @@ async def main(args: argparse.Namespace) -> None:
             # Wait for the user to stop recording
             console.print("Type 'stop' and press Enter to end recording.", style="bold yellow")
             while True:
-                command = await asyncio.to_thread(sys.stdin.readline)
+                command = await read_line()
                 if command.strip().lower() == 'stop':
                     break
                 console.print("Invalid command. Please type 'stop' to end recording.", style="bold red")
@@ -86,13 +129,16 @@ async def main(args: argparse.Namespace) -> None:
 
             # Download the video and its GPMF data
             console.print(f"Downloading {video.filename}...")
-            await gopro.http_command.download_file(
-                camera_file=video.filename, local_file=output_path.with_suffix(".mp4")
-            )
-            await gopro.http_command.get_gpmf_data(
-                camera_file=video.filename, local_file=output_path.with_suffix(".gpmf")
+            # Both are independent GETs to the camera, so fetch them concurrently
+            await asyncio.gather(
+                gopro.http_command.download_file(
+                    camera_file=video.filename, local_file=mp4_path
+                ),
+                gopro.http_command.get_gpmf_data(
+                    camera_file=video.filename, local_file=gpmf_path
+                ),
             )
-            console.print(f"Success!! :smiley: Files have been downloaded to '{output_path.with_suffix('.mp4')}'")
+            console.print(f"Success!! :smiley: Files have been downloaded to '{mp4_path}'")
     except Exception as e:  # pylint: disable = broad-except
         logger.error(repr(e))
     finally:
@@ -115,12 +161,17 @@ def parse_arguments() -> argparse.Namespace:
 
 def entrypoint() -> None:
     """Entrypoint for poetry script."""
+    # Ensure the output directory exists
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+
     # This is a workaround to prevent a NotImplementedError on Windows with Python 3.8+
     # See: https://github.com/aio-libs/aiohttp/issues/4324
     if sys.platform == "win32":
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
-        
-    asyncio.run(main(parse_arguments()))
+
+    # uvloop is POSIX-only, so on Windows this always falls back to the selector loop above
+    run = uvloop.run if UVLOOP_AVAILABLE else asyncio.run
+    run(main(parse_arguments()))
 
 
 if __name__ == "__main__":
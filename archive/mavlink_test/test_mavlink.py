@@ -20,7 +20,6 @@
 # 3. Run the script from the terminal:
 #    python pixhawk_stream.py
 
-import time
 from pymavlink import mavutil
 
 def connect_to_pixhawk(connection_string, baudrate):
@@ -37,7 +36,13 @@ def connect_to_pixhawk(connection_string, baudrate):
     print(f"Attempting to connect to Pixhawk on {connection_string} at {baudrate} baud...")
     try:
         # Start a connection listening to a serial port
-        master = mavutil.mavlink_connection(connection_string, baud=baudrate)
+        # use_native selects pymavlink's C parser when it was built; otherwise the Python one is used
+        master = mavutil.mavlink_connection(connection_string, baud=baudrate, use_native=True)
+        try:
+            # Drop the USB-serial latency timer to 1 ms (FTDI defaults to 16 ms); pyserial only supports this on Linux
+            master.port.set_low_latency_mode(True)
+        except (AttributeError, NotImplementedError, OSError, ValueError):
+            pass # TCP/UDP links, other platforms, or drivers that don't support it
 
         # Wait for the first heartbeat
         # This confirms a connection has been established
@@ -46,6 +51,7 @@ def connect_to_pixhawk(connection_string, baudrate):
         print("Heartbeat from system (system %u component %u)" %
               (master.target_system, master.target_component))
         print("Connection successful!")
+        print(f"MAVLink {mavutil.mavlink.WIRE_PROTOCOL_VERSION}, native parser: {master.mav.native is not None}")
         return master
     except Exception as e:
         print(f"Failed to connect: {e}")
@@ -70,6 +76,22 @@ def request_data_stream(master, stream_id, rate):
         1                        # Start/stop (1 for start)
     )
 
+def print_attitude(msg):
+    print(f"ATTITUDE: Roll={msg.roll:.2f}, Pitch={msg.pitch:.2f}, Yaw={msg.yaw:.2f}")
+
+def print_gps(msg):
+    print(f"GPS: Lat={msg.lat/1e7}, Lon={msg.lon/1e7}, Alt={msg.relative_alt/1000.0}m")
+
+def print_vfr_hud(msg):
+    print(f"VFR_HUD: Alt={msg.alt:.2f}m, Groundspeed={msg.groundspeed:.2f}m/s")
+
+# Message type -> printer. You can filter for more message types by adding them here
+MESSAGE_PRINTERS = {
+    'ATTITUDE': print_attitude,
+    'GLOBAL_POSITION_INT': print_gps,   # GPS data
+    'VFR_HUD': print_vfr_hud,           # Velocity, Altitude, etc.
+}
+
 def listen_for_messages(master):
     """
     Enters a loop to listen for and print incoming MAVLink messages.
@@ -81,33 +103,17 @@ def listen_for_messages(master):
     print("Press Ctrl+C to exit.")
     try:
         while True:
-            # Wait for a new message
-            msg = master.recv_match(blocking=True)
-
-            # Check if a message was received
-            if not msg:
-                continue
-
-            # Print the message type and its contents
-            # You can filter for specific messages here
-            msg_type = msg.get_type()
-            
-            # Example: Filter for ATTITUDE messages
-            if msg_type == 'ATTITUDE':
-                print(f"ATTITUDE: Roll={msg.roll:.2f}, Pitch={msg.pitch:.2f}, Yaw={msg.yaw:.2f}")
-
-            # Example: Filter for GLOBAL_POSITION_INT (GPS data)
-            elif msg_type == 'GLOBAL_POSITION_INT':
-                print(f"GPS: Lat={msg.lat/1e7}, Lon={msg.lon/1e7}, Alt={msg.relative_alt/1000.0}m")
-            
-            # Example: Filter for VFR_HUD (Velocity, Altitude, etc.)
-            elif msg_type == 'VFR_HUD':
-                 print(f"VFR_HUD: Alt={msg.alt:.2f}m, Groundspeed={msg.groundspeed:.2f}m/s")
-            
-            # To see all messages, uncomment the line below
-            # print(f"Received: {msg}")
-
-            time.sleep(0.01) # Small delay to prevent busy-waiting
+            # Handle everything that has already arrived
+            while (msg := master.recv_msg()) is not None:
+                printer = MESSAGE_PRINTERS.get(msg.get_type())
+                if printer:
+                    printer(msg)
+
+                # To see all messages, uncomment the line below
+                # print(f"Received: {msg}")
+
+            # Sleep until the port is readable instead of a fixed delay after every message
+            master.select(0.05)
 
     except KeyboardInterrupt:
         print("\n--- Exiting message listener ---")
@@ -1,3 +1,4 @@
+import socket
 import time
 from pymavlink import mavutil
 
@@ -16,18 +17,22 @@ except Exception as e:
 vehicle.wait_heartbeat()
 print("Heartbeat from system (system %u component %u)" % (vehicle.target_system, vehicle.target_component))
 
+# Don't let the kernel hold back small MAVLink frames on the TCP link
+vehicle.port.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
 # Loop to read and print specific MAVLink messages
+last_print = 0.0
 while True:
     try:
         # Check for GLOBAL_POSITION_INT message which contains altitude
         msg = vehicle.recv_match(type='GLOBAL_POSITION_INT', blocking=True, timeout=3)
-        if msg:
+        # Keep draining the stream, but only print about once a second
+        if msg and time.monotonic() - last_print > 1.0:
+            last_print = time.monotonic()
             # Altitude is in millimeters, convert to meters
             altitude_m = msg.relative_alt / 1000.0
             print(f"Current Altitude: {altitude_m:.2f} meters")
 
-        time.sleep(1) # Wait for a second before checking again
-
     except KeyboardInterrupt:
         print("\nExiting script.")
         break
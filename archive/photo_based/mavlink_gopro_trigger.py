@@ -11,7 +11,6 @@
 
 import argparse
 import asyncio
-import threading
 from datetime import datetime
 from pathlib import Path
 
@@ -62,48 +61,83 @@ async def take_photo(gopro: GoProBase, output_dir: Path) -> None:
 
 # --- MAVLink Communication ---
 
-def mavlink_listener(
+TRIGGER_TYPES = ["COMMAND_LONG", "MISSION_FINISHED"]
+
+
+def handle_message(msg, gopro: GoProBase, output_dir: Path, photo_tasks: set) -> bool:
+    """
+    Acts on one MAVLink message, starting a photo for each camera trigger.
+    Returns True once the mission is over and listening should stop.
+    """
+    msg_type = msg.get_type()
+    console.print(f"\n[blue]MAVLink message received: {msg_type}[/blue]")
+
+    # Stop condition: Mission has ended
+    if msg_type == "MISSION_FINISHED":
+        console.print("[bold red]Mission finished message received. Stopping...[/bold red]")
+        return True
+
+    # Handle commands
+    if msg_type == "COMMAND_LONG":
+        # Trigger condition: DO_SET_CAM_TRIGG_DIST
+        if msg.command == mavutil.mavlink.MAV_CMD_DO_SET_CAM_TRIGG_DIST:
+            # Already on the event loop, so the photo starts straight away
+            task = asyncio.create_task(take_photo(gopro, output_dir))
+            photo_tasks.add(task)
+            task.add_done_callback(photo_tasks.discard)
+
+        # Stop condition: IMAGE_STOP_CAPTURE
+        elif msg.command == mavutil.mavlink.MAV_CMD_IMAGE_STOP_CAPTURE:
+            console.print("[bold red]Image stop capture command received. Stopping...[/bold red]")
+            return True
+    return False
+
+
+async def mavlink_listener(
     mav_connection: mavutil.mavlink_connection,
     gopro: GoProBase,
     output_dir: Path,
-    loop: asyncio.AbstractEventLoop,
-    stop_event: threading.Event,
 ) -> None:
     """
-    Listens for MAVLink messages in a blocking manner and triggers GoPro.
-    This function is designed to be run in a separate thread.
+    Listens for MAVLink messages on the event loop and triggers the GoPro,
+    returning once the mission ends and any photos in progress are saved.
     """
-    console.print("[bold blue]MAVLink listener thread started. Waiting for triggers...[/bold blue]")
-    while not stop_event.is_set():
-        # Wait for a command or mission finished message. Using a timeout allows checking the stop_event.
-        msg = mav_connection.recv_match(
-            type=["COMMAND_LONG", "MISSION_FINISHED"], blocking=True, timeout=1
-        )
-        if not msg:
-            continue
-
-        msg_type = msg.get_type()
-        console.print(f"\n[blue]MAVLink message received: {msg_type}[/blue]")
-
-        # Stop condition: Mission has ended
-        if msg_type == "MISSION_FINISHED":
-            console.print("[bold red]Mission finished message received. Stopping...[/bold red]")
-            stop_event.set()
-            break
-
-        # Handle commands
-        if msg_type == "COMMAND_LONG":
-            # Trigger condition: DO_SET_CAM_TRIGG_DIST
-            if msg.command == mavutil.mavlink.MAV_CMD_DO_SET_CAM_TRIGG_DIST:
-                # Schedule the async take_photo function to run on the main event loop
-                asyncio.run_coroutine_threadsafe(take_photo(gopro, output_dir), loop)
-
-            # Stop condition: IMAGE_STOP_CAPTURE
-            elif msg.command == mavutil.mavlink.MAV_CMD_IMAGE_STOP_CAPTURE:
-                console.print("[bold red]Image stop capture command received. Stopping...[/bold red]")
+    console.print("[bold blue]MAVLink listener started. Waiting for triggers...[/bold blue]")
+    photo_tasks: set[asyncio.Task] = set()
+    stop_event = asyncio.Event()
+
+    def drain() -> None:
+        # The connection reads without blocking, so handle everything that has arrived
+        while (msg := mav_connection.recv_match(type=TRIGGER_TYPES, blocking=False)) is not None:
+            if handle_message(msg, gopro, output_dir, photo_tasks):
                 stop_event.set()
-                break
-    console.print("[bold blue]MAVLink listener thread finished.[/bold blue]")
+                return
+
+    loop = asyncio.get_running_loop()
+    watching = False
+    if mav_connection.fd is not None:
+        try:
+            # Wake only when the serial port or socket has data
+            loop.add_reader(mav_connection.fd, drain)
+            watching = True
+        except NotImplementedError:
+            pass # Windows' default Proactor loop can't watch any fd, sockets included
+
+    if watching:
+        try:
+            await stop_event.wait()
+        finally:
+            loop.remove_reader(mav_connection.fd)
+    else:
+        # No selectable fd or no add_reader support, so wait in a worker thread instead
+        while not stop_event.is_set():
+            msg = await asyncio.to_thread(mav_connection.recv_match, type=TRIGGER_TYPES, blocking=True, timeout=1)
+            if msg and handle_message(msg, gopro, output_dir, photo_tasks):
+                stop_event.set()
+
+    if photo_tasks:
+        await asyncio.gather(*photo_tasks)
+    console.print("[bold blue]MAVLink listener finished.[/bold blue]")
 
 
 # --- Main Application ---
@@ -112,7 +146,6 @@ async def main(args: argparse.Namespace) -> None:
     """The main async event loop."""
     logger = setup_logging(__name__, args.log)
     gopro: GoProBase | None = None
-    stop_event = threading.Event()
 
     # Define and create the output directory
     output_dir = Path("output")
@@ -121,10 +154,18 @@ async def main(args: argparse.Namespace) -> None:
     try:
         # Establish MAVLink Connection
         console.print(f"Connecting to Pixhawk at {args.connect}...")
-        mav_connection = mavutil.mavlink_connection(args.connect, baud=args.baud)
+        # use_native selects pymavlink's C parser when it was built; otherwise the Python one is used
+        mav_connection = mavutil.mavlink_connection(args.connect, baud=args.baud, use_native=True)
+        try:
+            # Drop the USB-serial latency timer to 1 ms (FTDI defaults to 16 ms); pyserial only supports this on Linux
+            mav_connection.port.set_low_latency_mode(True)
+        except (AttributeError, NotImplementedError, OSError, ValueError):
+            pass # TCP/UDP links, other platforms, or drivers that don't support it
         mav_connection.wait_heartbeat()
         console.print("[bold green]✅ Pixhawk connection successful! System ID: {}, Component ID: {}[/bold green]".format(
             mav_connection.target_system, mav_connection.target_component))
+        if mav_connection.mav.native is None:
+            console.print("[yellow]pymavlink's native parser is unavailable; using the Python parser.[/yellow]")
             
         # Establish Wired GoPro Connection
         console.print("Connecting to GoPro via USB...")
@@ -133,26 +174,12 @@ async def main(args: argparse.Namespace) -> None:
             # Load photo preset
             await gopro.http_command.load_preset_group(group=proto.EnumPresetGroup.PRESET_GROUP_ID_PHOTO)
             
-            # Start the MAVLink listener in a background thread
-            loop = asyncio.get_running_loop()
-            listener_thread = threading.Thread(
-                target=mavlink_listener,
-                args=(mav_connection, gopro, output_dir, loop, stop_event),
-                daemon=True,
-            )
-            listener_thread.start()
-
-            # Keep the main async task running until the stop event is set
-            while not stop_event.is_set():
-                await asyncio.sleep(1)
-            
-            # Wait for the listener thread to finish
-            listener_thread.join()
+            # Listen for triggers until the mission ends
+            await mavlink_listener(mav_connection, gopro, output_dir)
 
     except Exception as e:
         logger.error(repr(e))
         console.print(f"[bold red]An error occurred: {repr(e)}[/bold red]")
-        stop_event.set() # Ensure listener thread exits on error
     finally:
         console.print("Closing connections...")
         if gopro and gopro.is_open:
@@ -1,6 +1,9 @@
 from pymavlink import mavutil
 import re
 
+# The text looks like: "Mission: 9 SetCamTrigDst"
+TRIGGER_RE = re.compile(r'Mission: (\d+) SetCamTrigDst')
+
 # ===============================
 # 1. Connect to the Vehicle
 # ===============================
@@ -40,9 +43,8 @@ try:
         # Check if the text contains the string for the camera trigger command
         if "SetCamTrigDst" in message_text:
             
-            # The text looks like: "Mission: 9 SetCamTrigDst"
             # We can use regex to extract the waypoint number
-            match = re.search(r'Mission: (\d+) SetCamTrigDst', message_text)
+            match = TRIGGER_RE.search(message_text)
             
             print("="*50)
             if match:
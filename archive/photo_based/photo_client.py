@@ -15,6 +15,13 @@ from open_gopro.models import constants, proto
 from open_gopro.util import add_cli_args_and_parse
 from open_gopro.util.logger import setup_logging
 
+try:
+    import uvloop
+    # uvloop.run only exists from 0.18; older installs (e.g. Debian bookworm's 0.17) use asyncio.run
+    UVLOOP_AVAILABLE = hasattr(uvloop, "run")
+except ImportError:
+    UVLOOP_AVAILABLE = False
+
 console = Console()
 
 
@@ -22,6 +29,8 @@ async def main(args: argparse.Namespace) -> None:
     """The main async event loop."""
     logger = setup_logging(__name__, args.log)
     gopro: GoProBase | None = None
+    # Resolve the output path once up front rather than in the success log
+    output_path = Path(args.output).absolute()
 
     try:
         # Establish a wired connection to the GoPro
@@ -43,8 +52,8 @@ async def main(args: argparse.Namespace) -> None:
 
             # Download the newly captured photo
             console.print(f"Downloading {new_photo.filename}...")
-            await gopro.http_command.download_file(camera_file=new_photo.filename, local_file=args.output)
-            console.print(f"Success! :smiley: File has been downloaded to {Path(args.output).absolute()}")
+            await gopro.http_command.download_file(camera_file=new_photo.filename, local_file=output_path)
+            console.print(f"Success! :smiley: File has been downloaded to {output_path}")
 
     except Exception as e:  # pylint: disable = broad-except
         logger.error(repr(e))
@@ -70,7 +79,8 @@ def parse_arguments() -> argparse.Namespace:
 
 def entrypoint() -> None:
     """The main program entrypoint."""
-    asyncio.run(main(parse_arguments()))
+    run = uvloop.run if UVLOOP_AVAILABLE else asyncio.run
+    run(main(parse_arguments()))
 
 
 if __name__ == "__main__":
@@ -16,6 +16,13 @@ from open_gopro.models import constants, proto
 from open_gopro.util import add_cli_args_and_parse
 from open_gopro.util.logger import setup_logging
 
+try:
+    import uvloop
+    # uvloop.run only exists from 0.18; older installs (e.g. Debian bookworm's 0.17) use asyncio.run
+    UVLOOP_AVAILABLE = hasattr(uvloop, "run")
+except ImportError:
+    UVLOOP_AVAILABLE = False
+
 console = Console()
 
 
@@ -24,8 +31,8 @@ async def main(args: argparse.Namespace) -> None:
     logger = setup_logging(__name__, args.log)
     gopro: GoProBase | None = None
 
-    # Define and create the output directory
-    output_dir = Path("output")
+    # Define and create the output directory (absolute, so per-photo paths are ready to log)
+    output_dir = Path("output").absolute()
     output_dir.mkdir(parents=True, exist_ok=True)
 
     try:
@@ -53,7 +60,7 @@ async def main(args: argparse.Namespace) -> None:
             # Download the newly captured photo
             console.print(f"Downloading {new_photo.filename}...")
             await gopro.http_command.download_file(camera_file=new_photo.filename, local_file=output_file)
-            console.print(f"Success! :smiley: File has been downloaded to {output_file.absolute()}")
+            console.print(f"Success! :smiley: File has been downloaded to {output_file}")
 
     except Exception as e:  # pylint: disable = broad-except
         logger.error(repr(e))
@@ -72,7 +79,8 @@ def parse_arguments() -> argparse.Namespace:
 
 def entrypoint() -> None:
     """The main program entrypoint."""
-    asyncio.run(main(parse_arguments()))
+    run = uvloop.run if UVLOOP_AVAILABLE else asyncio.run
+    run(main(parse_arguments()))
 
 
 if __name__ == "__main__":
@@ -1,6 +1,9 @@
 import argparse
 import asyncio
+import contextvars
+import functools
 import re
+import socket
 from datetime import datetime
 from pathlib import Path
 from types import SimpleNamespace
@@ -9,19 +12,46 @@ from pymavlink import mavutil
 from rich.console import Console
 
 # --- GoPro Library Imports ---
-# This script requires the open_gopro library to be installed.
+# The open_gopro library is slow to import, so it is only loaded by load_open_gopro()
+# in the real-GoPro modes. Until then these stand in for the simulated camera.
 # Use: pip install open_gopro
-from open_gopro.gopro_base import GoProBase
-from open_gopro.models import constants, proto
-from open_gopro import WiredGoPro, WirelessGoPro
-from open_gopro.util import add_cli_args_and_parse
-from open_gopro.util.logger import setup_logging
+constants = SimpleNamespace(Toggle=SimpleNamespace(ENABLE=1, DISABLE=0))
+proto = WiredGoPro = setup_logging = None
+
+
+def load_open_gopro():
+    """Imports open_gopro into the module globals and returns its CLI parser helper."""
+    global constants, proto, WiredGoPro, setup_logging
+    from open_gopro import WiredGoPro
+    from open_gopro.models import constants, proto
+    from open_gopro.util import add_cli_args_and_parse
+    from open_gopro.util.logger import setup_logging
+    return add_cli_args_and_parse
+
+
+try:
+    import uvloop
+    # uvloop.run only exists from 0.18; older installs (e.g. Debian bookworm's 0.17) use asyncio.run
+    UVLOOP_AVAILABLE = hasattr(uvloop, "run")
+except ImportError:
+    UVLOOP_AVAILABLE = False
 
 
 console = Console()
 
+# Compiled once; matched against every camera-trigger STATUSTEXT.
+TRIGGER_RE = re.compile(r"Mission: (\d+) SetCamTrigDst")
+# 4-digit file counter and extension at the end of a GoPro photo name, e.g. GOPR0042.JPG.
+# Videos are left out: GX010043.MP4 would otherwise read as 10043 and every prediction would be a video
+PHOTO_NUMBER_RE = re.compile(r"(\d{4})(\.(?:jpg|gpr))$", re.IGNORECASE)
+
+# Errors that mean the GoPro session itself is gone and has to be re-opened
+CONNECTION_ERRORS = (OSError, asyncio.TimeoutError)
+MAX_CAPTURE_FAILURES = 3
+
 # --- Shared state variable to control the photo-taking loop ---
-take_photos = False
+# Set while the mission wants photos; the controller awaits it instead of polling.
+photo_event = asyncio.Event()
 gopro_is_ready = False
 
 # =================================================================
@@ -31,7 +61,7 @@ gopro_is_ready = False
 class MockHttpCommand:
     """A mock of the GoPro's HTTP command object."""
     def __init__(self):
-        self._photo_taken = False
+        self._last_index = 1
 
     async def load_preset_group(self, group):
         console.print(f"[green](Simulated)[/green] Set preset group to {group}")
@@ -39,21 +69,24 @@ class MockHttpCommand:
 
     async def get_media_list(self):
         console.print("[green](Simulated)[/green] Getting media list")
-        if self._photo_taken:
-            self._photo_taken = False
-            # Simulate a new file appearing
-            return SimpleNamespace(data=SimpleNamespace(files=[SimpleNamespace(filename=f"GOPR{datetime.now().second:04d}.JPG")]))
-        return SimpleNamespace(data=SimpleNamespace(files=[SimpleNamespace(filename="GOPR0001.JPG")]))
+        # The newest file is whatever the last shutter press produced
+        return SimpleNamespace(data=SimpleNamespace(files=[SimpleNamespace(filename=f"GOPR{self._last_index:04d}.JPG")]))
+
+    async def get_media_metadata(self, path):
+        console.print(f"[green](Simulated)[/green] Getting metadata for {path}")
+        return SimpleNamespace(ok=path == f"GOPR{self._last_index:04d}.JPG")
 
     async def set_shutter(self, shutter):
         console.print(f"[green](Simulated)[/green] Set shutter to {shutter}")
-        self._photo_taken = True
+        self._last_index += 1
         return SimpleNamespace(ok=True)
 
     async def download_file(self, camera_file, local_file):
         console.print(f"[green](Simulated)[/green] Downloading {camera_file} to {local_file}")
-        with open(local_file, "w") as f:
-            f.write(f"This is a simulated image of {camera_file}.\n")
+        # Write off the event loop so a slow SD card can't stall the MAVLink listener
+        await asyncio.to_thread(
+            Path(local_file).write_text, f"This is a simulated image of {camera_file}.\n"
+        )
         await asyncio.sleep(0.1)
 
 class MockGoPro:
@@ -76,11 +109,36 @@ class MockGoPro:
 # 🦾 GOPRO AND MAVLINK CONTROLLERS
 # =================================================================
 
+def predict_next_photo(filenames) -> str | None:
+    """Guesses the camera's next photo filename from the highest photo counter seen so far."""
+    best = None
+    for name in filenames:
+        match = PHOTO_NUMBER_RE.search(name)
+        if match and (best is None or int(match.group(1)) > int(best.group(1))):
+            best = match
+    if best is None:
+        return None
+    digits = best.group(1)
+    next_number = f"{int(digits) + 1:0{len(digits)}d}"
+    return best.string[:best.start(1)] + next_number + best.group(2)
+
+
+async def download_photo(gopro, camera_file: str, output_file: Path):
+    """Downloads one photo from the camera; run as a task so it overlaps the next capture."""
+    console.print(f"Downloading {camera_file}...")
+    await gopro.http_command.download_file(camera_file=camera_file, local_file=output_file)
+    console.print(f"✅ Success! File downloaded to {output_file.absolute()}")
+
+
 async def gopro_controller(args: argparse.Namespace, output_dir: Path):
     """Manages connection to the GoPro (real or simulated) and takes photos."""
-    global take_photos, gopro_is_ready
+    global gopro_is_ready
     # The script logic is designed for a wired connection in hardware modes.
     GoProDevice = WiredGoPro if args.use_real_gopro else MockGoPro
+    download_task: asyncio.Task | None = None
+    # Format the wall-clock time once; a counter keeps same-second shots from colliding
+    session_start = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    shot_index = 0
 
     while True:
         try:
@@ -102,47 +160,101 @@ async def gopro_controller(args: argparse.Namespace, output_dir: Path):
                     await asyncio.sleep(10)
                     continue
 
+                # Fetch the media list once, then only track filenames that appear after it
+                media_list_before = await gopro.http_command.get_media_list()
+                known_filenames = set(f.filename for f in media_list_before.data.files)
+                expected_name = predict_next_photo(known_filenames)
+
+                capture_failures = 0
                 while True:
-                    if take_photos:
+                    # Sleep until the MAVLink listener starts a capture run
+                    await photo_event.wait()
+                    try:
                         console.print("\nCapturing a photo...")
-                        media_list_before = await gopro.http_command.get_media_list()
-                        media_set_before = set(f.filename for f in media_list_before.data.files)
 
                         shutter_command = getattr(constants, 'Toggle', SimpleNamespace(ENABLE=1)).ENABLE
                         assert (await gopro.http_command.set_shutter(shutter=shutter_command)).ok
 
-                        new_photos = set()
-                        for _ in range(5): # Retry for 2.5 seconds
-                            await asyncio.sleep(0.5)
-                            media_list_after = await gopro.http_command.get_media_list()
-                            media_set_after = set(f.filename for f in media_list_after.data.files)
-                            new_photos = media_set_after.difference(media_set_before)
-                            if new_photos:
+                        # Probe only the expected filename rather than pulling the whole media list
+                        new_photos = []
+                        # Poll fast at first and back off, giving up after 2.5 seconds
+                        loop = asyncio.get_running_loop()
+                        deadline = loop.time() + 2.5
+                        delay = 0.05
+                        while expected_name and loop.time() < deadline:
+                            await asyncio.sleep(delay)
+                            if (await gopro.http_command.get_media_metadata(path=expected_name)).ok:
+                                new_photos = [expected_name]
                                 break
+                            delay = min(delay * 1.6, 0.4)
+
+                        if not new_photos:
+                            # Numbering didn't match the guess; fall back to diffing the full list
+                            media_list_after = await gopro.http_command.get_media_list()
+                            new_photos = [f.filename for f in media_list_after.data.files if f.filename not in known_filenames]
 
                         if not new_photos:
                             console.print("[red]Could not find new photo after capture.[/red]")
                             continue
 
+                        known_filenames.update(new_photos)
                         new_photo_name = new_photos.pop()
-                        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-                        output_file = output_dir / f"{timestamp}_{new_photo_name}"
-
-                        console.print(f"Downloading {new_photo_name}...")
-                        await gopro.http_command.download_file(camera_file=new_photo_name, local_file=output_file)
-                        console.print(f"✅ Success! File downloaded to {output_file.absolute()}")
-
-                        await asyncio.sleep(3)
-                    else:
-                        await asyncio.sleep(0.5)
+                        expected_name = predict_next_photo([new_photo_name])
+                        shot_index += 1
+                        output_file = output_dir / f"{session_start}_{shot_index:05d}_{new_photo_name}"
+
+                        # Let the previous download finish before starting this one, so transfers
+                        # overlap with the next capture but never pile up
+                        if download_task:
+                            # Clear it first so a failed download isn't awaited twice
+                            previous_download, download_task = download_task, None
+                            try:
+                                await previous_download
+                            except Exception as e:
+                                # The earlier photo is lost, but this one must still be downloaded
+                                console.print(f"[red]Previous download failed: {repr(e)}[/red]")
+                        download_task = asyncio.create_task(
+                            download_photo(gopro, new_photo_name, output_file)
+                        )
+                    except CONNECTION_ERRORS:
+                        raise
+                    except Exception as e:
+                        # A failed command doesn't mean the session is gone; retry before reconnecting
+                        capture_failures += 1
+                        if capture_failures >= MAX_CAPTURE_FAILURES:
+                            raise
+                        console.print(f"[yellow]Capture failed: {repr(e)}. Retrying ({capture_failures}/{MAX_CAPTURE_FAILURES})...[/yellow]")
+                        await asyncio.sleep(1)
+                        continue
+                    capture_failures = 0
+
+                    await asyncio.sleep(3)
         except Exception as e:
             console.print(f"[bold red]GoPro Controller Error: {repr(e)}. Retrying in 10 seconds...[/bold red]")
             gopro_is_ready = False
+            if download_task:
+                download_task.cancel()
+                download_task = None
             await asyncio.sleep(10)
 
+def disable_nagle(master):
+    """Turns off Nagle's algorithm on a TCP MAVLink link; serial links are left alone."""
+    try:
+        master.port.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except (AttributeError, OSError):
+        pass
+
+async def fast_to_thread(func, /, *args, **kwargs):
+    """Like asyncio.to_thread, but skips the context copy wrapper when there is nothing to carry."""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, func, *args, **kwargs) if len(ctx) else functools.partial(func, *args, **kwargs)
+    return await loop.run_in_executor(None, call)
+
+
 async def mavlink_listener(connection_string: str):
     """Listens for MAVLink messages and toggles the photo-taking state."""
-    global take_photos, gopro_is_ready
+    global gopro_is_ready
 
     while True:
         try:
@@ -157,14 +269,19 @@ async def mavlink_listener(connection_string: str):
 
             master.wait_heartbeat()
             console.print(f"✅ MAVLink Heartbeat received from System ID: {master.target_system}")
+            # Don't let the kernel hold back small MAVLink frames on TCP links
+            disable_nagle(master)
 
             while True:
-                msg = master.recv_match(type="STATUSTEXT", blocking=False)
+                # Block in a worker thread until a STATUSTEXT arrives instead of polling every 100 ms
+                msg = await fast_to_thread(
+                    master.recv_match, type="STATUSTEXT", blocking=True, timeout=1.0
+                )
                 if msg:
                     message_text = msg.text.strip()
                     if "DigiCamCtrl" in message_text:
-                        if take_photos:
-                            take_photos = False
+                        if photo_event.is_set():
+                            photo_event.clear()
                             console.print(f"\n\n{'='*50}\n⏹️⏹️⏹️ [bold blue]STOPPING[/bold blue] Photo Capture due to DigiCamCtrl command.\n{'='*50}\n")
                         console.print(f"\n\n{'='*50}\n🎉 [bold magenta]Mission Complete: 'DigiCamCtrl' detected.[/bold magenta]\n{'='*50}\n")
                     elif "SetCamTrigDst" in message_text:
@@ -172,15 +289,17 @@ async def mavlink_listener(connection_string: str):
                             console.print("[yellow]MAVLink trigger detected, but GoPro is not ready.[/yellow]")
                             continue
                         
-                        take_photos = not take_photos
-                        match = re.search(r"Mission: (\d+) SetCamTrigDst", message_text)
+                        if photo_event.is_set():
+                            photo_event.clear()
+                        else:
+                            photo_event.set()
+                        match = TRIGGER_RE.search(message_text)
                         waypoint_num = match.group(1) if match else "N/A"
 
-                        if take_photos:
+                        if photo_event.is_set():
                             console.print(f"\n\n{'='*50}\n▶️▶️▶️ [bold green]STARTING[/bold green] Photo Capture (Waypoint #{waypoint_num})!\n{'='*50}\n")
                         else:
                             console.print(f"\n\n{'='*50}\n⏹️⏹️⏹️ [bold red]STOPPING[/bold red] Photo Capture (Waypoint #{waypoint_num})!\n{'='*50}\n")
-                await asyncio.sleep(0.1)
         except Exception as e:
             console.print(f"[bold red]MAVLink connection error: {repr(e)}. Retrying in 10 seconds...[/bold red]")
             await asyncio.sleep(10)
@@ -193,6 +312,10 @@ async def main(args: argparse.Namespace):
     output_dir = Path("gopro_captures")
     output_dir.mkdir(parents=True, exist_ok=True)
 
+    # Run new tasks inline until they first block (Python 3.12+)
+    if hasattr(asyncio, "eager_task_factory"):
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+
     try:
         await asyncio.gather(
             mavlink_listener(args.connection_string),
@@ -239,7 +362,8 @@ def entrypoint():
     # Handle GoPro-specific arguments or simulation setup
     if args.use_real_gopro:
         # Let open-gopro parse its own arguments (e.g., --identifier)
-        # If the library is missing, the script will have already crashed at the import stage.
+        # If the library is missing, the script will crash here at the import stage.
+        add_cli_args_and_parse = load_open_gopro()
         gopro_parser = argparse.ArgumentParser()
         gopro_args = add_cli_args_and_parse(gopro_parser, unknown_args)
         # Merge the arguments
@@ -251,7 +375,8 @@ def entrypoint():
         args.log = None
 
     try:
-        asyncio.run(main(args))
+        run = uvloop.run if UVLOOP_AVAILABLE else asyncio.run
+        run(main(args))
     except Exception as e:
         console.print(f"Failed to start asyncio event loop: {repr(e)}")
 
@@ -260,7 +385,7 @@ def entrypoint():
 # =================================================================
 #
 # Save the script as a Python file (e.g., pix2rasp.py) and run from your terminal.
-# The 'open_gopro' library MUST be installed: pip install open_gopro
+# The 'open_gopro' library MUST be installed for the real-GoPro modes: pip install open_gopro
 #
 # --- Scenarios ---
 #
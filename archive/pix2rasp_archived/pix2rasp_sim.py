@@ -1,7 +1,10 @@
 import argparse
 import asyncio
+import logging
+import os
 import re
-from datetime import datetime
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
 from types import SimpleNamespace
 
@@ -18,11 +21,45 @@ try:
 except ImportError:
     GOPRO_LIB_AVAILABLE = False
 
+# --- Optional libuv-based event loop (not available on Windows) ---
+try:
+    import uvloop
+    # uvloop.run only exists from 0.18; older installs (e.g. Debian bookworm's 0.17) use asyncio.run
+    UVLOOP_AVAILABLE = hasattr(uvloop, "run")
+except ImportError:
+    UVLOOP_AVAILABLE = False
+
 console = Console()
+# Hot-path messages go through logging so they cost nothing unless debug output is on
+logger = logging.getLogger(__name__)
+
+# When each throttled message was last shown; see print_throttled()
+throttled_print_times = {}
+
+
+def print_throttled(message: str, interval: float = 1.0):
+    """Prints a message at most once per interval so repeated warnings don't flood the terminal."""
+    now = time.monotonic()
+    if now - throttled_print_times.get(message, float("-inf")) >= interval:
+        throttled_print_times[message] = now
+        console.print(message)
+
+# Compiled once; matched against every camera-trigger STATUSTEXT.
+TRIGGER_RE = re.compile(r"Mission: (\d+) SetCamTrigDst")
+
+# Errors that mean the GoPro session itself is gone and has to be re-opened
+CONNECTION_ERRORS = (OSError, asyncio.TimeoutError)
+MAX_CAPTURE_FAILURES = 3
+# Seconds queued downloads get to finish on the old session before a reconnect abandons them
+DOWNLOAD_DRAIN_TIMEOUT = 10
 
-# --- Shared state variable to control the photo-taking loop ---
-take_photos = False
-gopro_is_ready = False
+# --- Shared state to control the photo-taking loop ---
+@dataclass
+class CaptureState:
+    """State shared by the MAVLink listener and the GoPro controller."""
+    gopro_is_ready: bool = False
+    # Set while the mission wants photos; the controller awaits it instead of polling.
+    photo_event: asyncio.Event = field(default_factory=asyncio.Event)
 
 # =================================================================
 # 📸 MOCK GOPRO IMPLEMENTATION
@@ -31,29 +68,27 @@ gopro_is_ready = False
 class MockHttpCommand:
     """A mock of the GoPro's HTTP command object."""
     def __init__(self):
-        self._photo_taken = False
+        # Files on the simulated SD card; each shutter press adds a new one
+        self._files = [SimpleNamespace(filename="GOPR0001.JPG")]
 
     async def load_preset_group(self, group):
         console.print(f"[green](Simulated)[/green] Set preset group to {group}")
         return SimpleNamespace(ok=True)
 
     async def get_media_list(self):
-        console.print("[green](Simulated)[/green] Getting media list")
-        if self._photo_taken:
-            self._photo_taken = False
-            # Simulate a new file appearing
-            return SimpleNamespace(data=SimpleNamespace(files=[SimpleNamespace(filename=f"GOPR{datetime.now().second:04d}.JPG")]))
-        return SimpleNamespace(data=SimpleNamespace(files=[SimpleNamespace(filename="GOPR0001.JPG")]))
+        logger.debug("(Simulated) Getting media list")
+        return SimpleNamespace(data=SimpleNamespace(files=list(self._files)))
 
     async def set_shutter(self, shutter):
         console.print(f"[green](Simulated)[/green] Set shutter to {shutter}")
-        self._photo_taken = True
+        # Simulate a new file appearing
+        self._files.append(SimpleNamespace(filename=f"GOPR{len(self._files) + 1:04d}.JPG"))
         return SimpleNamespace(ok=True)
 
     async def download_file(self, camera_file, local_file):
-        console.print(f"[green](Simulated)[/green] Downloading {camera_file} to {local_file}")
-        with open(local_file, "w") as f:
-            f.write(f"This is a simulated image of {camera_file}.\n")
+        logger.debug("(Simulated) Downloading %s to %s", camera_file, local_file)
+        # Write off the event loop so the MAVLink listener keeps running
+        await asyncio.to_thread(Path(local_file).write_text, f"This is a simulated image of {camera_file}.\n")
         await asyncio.sleep(0.1)
 
 class MockGoPro:
@@ -76,118 +111,244 @@ class MockGoPro:
 # 🦾 GOPRO AND MAVLINK CONTROLLERS
 # =================================================================
 
-async def gopro_controller(args: argparse.Namespace, output_dir: Path):
-    """Manages connection to the GoPro (real or simulated) and takes photos."""
-    global take_photos, gopro_is_ready
-    GoProDevice = WiredGoPro if args.use_real_gopro else MockGoPro
+# --- Shared GoPro session, opened on first use and kept until the connection drops ---
+gopro_session = None
+
+async def get_gopro(args: argparse.Namespace):
+    """Returns the open GoPro session, connecting (real or simulated) on first use."""
+    global gopro_session
+    if gopro_session is None:
+        GoProDevice = WiredGoPro if args.use_real_gopro else MockGoPro
+        gopro_session = await GoProDevice(args.identifier).__aenter__()
+    return gopro_session
+
+async def release_gopro():
+    """Closes the shared GoPro session so the next get_gopro() call reconnects."""
+    global gopro_session
+    if gopro_session is not None:
+        session, gopro_session = gopro_session, None
+        try:
+            await session.__aexit__(None, None, None)
+        except Exception as e:
+            # A wedged camera may fail to close cleanly; the session is dropped either way
+            console.print(f"[yellow]Error closing GoPro session: {repr(e)}[/yellow]")
 
+async def download_worker(gopro, download_queue: asyncio.Queue):
+    """Downloads captured photos from the queue while the controller keeps shooting."""
     while True:
+        new_photo_name, output_file = await download_queue.get()
         try:
-            async with GoProDevice(args.identifier) as gopro:
-                console.print("📸 GoPro Initialized!")
-                # In simulation, we assume it's always ready. For real GoPro, check command success.
-                is_ready_to_start = False
-                if args.use_real_gopro:
-                     if (await gopro.http_command.load_preset_group(group=proto.EnumPresetGroup.PRESET_GROUP_ID_PHOTO)).ok:
-                         is_ready_to_start = True
-                else:
-                    is_ready_to_start = True
-
-                if is_ready_to_start:
-                    console.print("✅ GoPro is in Photo Mode.")
-                    gopro_is_ready = True
-                else:
-                    console.print("[red]Failed to set GoPro to photo mode.[/red]")
-                    gopro_is_ready = False
-                    await asyncio.sleep(10)
-                    continue
+            console.print(f"Downloading {new_photo_name}...")
+            await gopro.http_command.download_file(camera_file=new_photo_name, local_file=output_file)
+            console.print(f"✅ Success! File downloaded to {output_file.absolute()}")
+        except Exception as e:
+            console.print(f"[red]Failed to download {new_photo_name}: {repr(e)}[/red]")
+        except asyncio.CancelledError:
+            console.print(f"[red]Download of {new_photo_name} abandoned; the photo is still on the camera.[/red]")
+            raise
+        finally:
+            download_queue.task_done()
+
+async def capture_photo(gopro, known_files: set) -> set:
+    """Fires the shutter and returns the filenames that appeared on the card."""
+    console.print("\nCapturing a photo...")
+    shutter_command = getattr(constants, 'Toggle', SimpleNamespace(ENABLE=1)).ENABLE
+    assert (await gopro.http_command.set_shutter(shutter=shutter_command)).ok
+
+    new_photos = set()
+    delay = 0.05
+    for _ in range(8): # Back off from 50 ms to 0.5 s, ~2.75 seconds in total
+        await asyncio.sleep(delay)
+        media_list_after = await gopro.http_command.get_media_list()
+        media_set_after = {f.filename for f in media_list_after.data.files}
+        new_photos = media_set_after.difference(known_files)
+        if new_photos:
+            break
+        delay = min(delay * 2, 0.5)
+    return new_photos
+
+async def gopro_controller(args: argparse.Namespace, output_dir: Path, state: CaptureState):
+    """Manages connection to the GoPro (real or simulated) and takes photos."""
+    # Joined as plain strings per photo instead of going through Path arithmetic
+    output_dir_str = str(output_dir)
 
+    while True:
+        try:
+            gopro = await get_gopro(args)
+            console.print("📸 GoPro Initialized!")
+            # In simulation, we assume it's always ready. For real GoPro, check command success.
+            is_ready_to_start = False
+            if args.use_real_gopro:
+                 if (await gopro.http_command.load_preset_group(group=proto.EnumPresetGroup.PRESET_GROUP_ID_PHOTO)).ok:
+                     is_ready_to_start = True
+            else:
+                is_ready_to_start = True
+
+            if is_ready_to_start:
+                console.print("✅ GoPro is in Photo Mode.")
+                # Snapshot the card once; each capture then only needs the post-shutter list
+                media_list = await gopro.http_command.get_media_list()
+                known_files = {f.filename for f in media_list.data.files}
+                state.gopro_is_ready = True
+            else:
+                console.print("[red]Failed to set GoPro to photo mode.[/red]")
+                state.gopro_is_ready = False
+                await asyncio.sleep(10)
+                continue
+
+            # Downloads run in their own task so the next capture doesn't wait on them
+            download_queue = asyncio.Queue(maxsize=4)
+            downloader = asyncio.create_task(download_worker(gopro, download_queue))
+            try:
+                capture_failures = 0
                 while True:
-                    if take_photos:
-                        console.print("\nCapturing a photo...")
-                        media_list_before = await gopro.http_command.get_media_list()
-                        media_set_before = set(f.filename for f in media_list_before.data.files)
-
-                        shutter_command = getattr(constants, 'Toggle', SimpleNamespace(ENABLE=1)).ENABLE
-                        assert (await gopro.http_command.set_shutter(shutter=shutter_command)).ok
-
-                        new_photos = set()
-                        for _ in range(5): # Retry for 2.5 seconds
-                            await asyncio.sleep(0.5)
-                            media_list_after = await gopro.http_command.get_media_list()
-                            media_set_after = set(f.filename for f in media_list_after.data.files)
-                            new_photos = media_set_after.difference(media_set_before)
-                            if new_photos:
-                                break
-
-                        if not new_photos:
-                            console.print("[red]Could not find new photo after capture.[/red]")
-                            continue
-
-                        new_photo_name = new_photos.pop()
-                        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-                        output_file = output_dir / f"{timestamp}_{new_photo_name}"
-
-                        console.print(f"Downloading {new_photo_name}...")
-                        await gopro.http_command.download_file(camera_file=new_photo_name, local_file=output_file)
-                        console.print(f"✅ Success! File downloaded to {output_file.absolute()}")
-
-                        await asyncio.sleep(3)
-                    else:
-                        await asyncio.sleep(0.5)
+                    # Sleep until the MAVLink listener starts a capture run
+                    await state.photo_event.wait()
+                    try:
+                        new_photos = await capture_photo(gopro, known_files)
+                    except CONNECTION_ERRORS:
+                        raise
+                    except Exception as e:
+                        # A failed command doesn't mean the session is gone; retry before reconnecting
+                        capture_failures += 1
+                        if capture_failures >= MAX_CAPTURE_FAILURES:
+                            raise
+                        console.print(f"[yellow]Capture failed: {repr(e)}. Retrying ({capture_failures}/{MAX_CAPTURE_FAILURES})...[/yellow]")
+                        await asyncio.sleep(1)
+                        continue
+                    capture_failures = 0
+
+                    if not new_photos:
+                        print_throttled("[red]Could not find new photo after capture.[/red]")
+                        continue
+
+                    known_files |= new_photos
+                    new_photo_name = new_photos.pop()
+                    timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
+                    output_file = Path(os.path.join(output_dir_str, f"{timestamp}_{new_photo_name}"))
+                    await download_queue.put((new_photo_name, output_file))
+
+                    await asyncio.sleep(3)
+            finally:
+                # Let queued downloads finish if the session still works, then report any left behind
+                try:
+                    await asyncio.wait_for(download_queue.join(), timeout=DOWNLOAD_DRAIN_TIMEOUT)
+                except asyncio.TimeoutError:
+                    pass
+                downloader.cancel()
+                while not download_queue.empty():
+                    new_photo_name, _ = download_queue.get_nowait()
+                    console.print(f"[red]Download of {new_photo_name} abandoned; the photo is still on the camera.[/red]")
+        except CONNECTION_ERRORS as e:
+            console.print(f"[bold red]GoPro connection lost: {repr(e)}. Reconnecting in 10 seconds...[/bold red]")
+            state.gopro_is_ready = False
+            await release_gopro()
+            await asyncio.sleep(10)
         except Exception as e:
-            console.print(f"[bold red]GoPro Controller Error: {repr(e)}. Retrying in 10 seconds...[/bold red]")
-            gopro_is_ready = False
+            console.print(f"[bold red]GoPro Controller Error: {repr(e)}. Reconnecting in 10 seconds...[/bold red]")
+            state.gopro_is_ready = False
+            # Includes a camera that kept failing captures, so start over with a fresh session
+            await release_gopro()
             await asyncio.sleep(10)
 
-async def mavlink_listener(connection_string: str):
-    """Listens for MAVLink messages and toggles the photo-taking state."""
-    global take_photos, gopro_is_ready
+async def wait_for_mavlink_data(master, poll_interval: float = 0.1, timeout: float = 1.0):
+    """Sleeps until the MAVLink port is readable instead of polling on a fixed tick."""
+    try:
+        fd = master.port.fileno()
+    except (AttributeError, OSError):
+        # No selectable fd (e.g. Windows serial); fall back to polling.
+        await asyncio.sleep(poll_interval)
+        return
+
+    loop = asyncio.get_running_loop()
+    readable = asyncio.Event()
+    try:
+        loop.add_reader(fd, readable.set)
+    except NotImplementedError:
+        # Windows' default Proactor loop can't watch any fd, sockets included; poll instead.
+        await asyncio.sleep(poll_interval)
+        return
+    try:
+        await asyncio.wait_for(readable.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        loop.remove_reader(fd)
+
+def quiet_telemetry_streams(master):
+    """Stops periodic telemetry streams on this link; STATUSTEXT and heartbeats are still sent."""
+    master.mav.request_data_stream_send(
+        master.target_system,
+        master.target_component,
+        mavutil.mavlink.MAV_DATA_STREAM_ALL,
+        0,  # rate (Hz)
+        0,  # 0 = stop
+    )
+
+def handle_statustext(message_text: str, state: CaptureState):
+    """Toggles the photo-taking state from a single STATUSTEXT message."""
+    if "DigiCamCtrl" in message_text:
+        # If a mission complete message is received, stop taking photos.
+        if state.photo_event.is_set():
+            state.photo_event.clear()
+            console.print(f"\n\n{'='*50}\n⏹️⏹️⏹️ [bold blue]STOPPING[/bold blue] Photo Capture due to DigiCamCtrl command.\n{'='*50}\n")
+        console.print(f"\n\n{'='*50}\n🎉 [bold magenta]Mission Complete: 'DigiCamCtrl' detected.[/bold magenta]\n{'='*50}\n")
+
+    elif "SetCamTrigDst" in message_text:
+        if not state.gopro_is_ready:
+            print_throttled("[yellow]MAVLink trigger detected, but GoPro is not ready.[/yellow]")
+            return
+
+        # Toggle photo capture state
+        if state.photo_event.is_set():
+            state.photo_event.clear()
+        else:
+            state.photo_event.set()
+        match = TRIGGER_RE.search(message_text)
+        waypoint_num = match.group(1) if match else "N/A"
 
+        if state.photo_event.is_set():
+            console.print(f"\n\n{'='*50}\n▶️▶️▶️ [bold green]STARTING[/bold green] Photo Capture (Waypoint #{waypoint_num})!\n{'='*50}\n")
+        else:
+            console.print(f"\n\n{'='*50}\n⏹️⏹️⏹️ [bold red]STOPPING[/bold red] Photo Capture (Waypoint #{waypoint_num})!\n{'='*50}\n")
+
+async def mavlink_listener(connection_string: str, state: CaptureState):
+    """Listens for MAVLink messages and toggles the photo-taking state."""
     while True:
         try:
             master = None
             if connection_string.startswith('tcp:'):
                 console.print(f"📡 Connecting to MAVLink via TCP at {connection_string}...")
-                master = mavutil.mavlink_connection(connection_string)
+                master = await asyncio.to_thread(mavutil.mavlink_connection, connection_string)
             elif ':' in connection_string:
                 device, baud_rate = connection_string.split(':')
                 console.print(f"📡 Connecting to MAVLink via Serial at {device} (Baud: {baud_rate})...")
-                master = mavutil.mavlink_connection(device, baud=int(baud_rate))
+                master = await asyncio.to_thread(mavutil.mavlink_connection, device, baud=int(baud_rate))
             else:
                 # Default to serial with a standard baud if no baud is specified
                 console.print(f"📡 Connecting to MAVLink via Serial at {connection_string} (Baud: 57600)...")
-                master = mavutil.mavlink_connection(connection_string, baud=57600)
+                master = await asyncio.to_thread(mavutil.mavlink_connection, connection_string, baud=57600)
 
-            master.wait_heartbeat()
+            # Connecting and waiting for a heartbeat both block, so they run off the event loop
+            await asyncio.to_thread(master.wait_heartbeat)
             console.print(f"✅ MAVLink Heartbeat received from System ID: {master.target_system}")
+            # Only STATUSTEXT matters here, so don't pay to parse the rest of the telemetry
+            quiet_telemetry_streams(master)
 
+            # Only used when the port can't be waited on: poll fast while messages are
+            # flowing and back off towards 100 ms while the link is quiet.
+            idle_delay = 0.001
             while True:
-                msg = master.recv_match(type="STATUSTEXT", blocking=False)
-                if msg:
-                    message_text = msg.text.strip()
-                    if "DigiCamCtrl" in message_text:
-                        # If a mission complete message is received, stop taking photos.
-                        if take_photos:
-                            take_photos = False
-                            console.print(f"\n\n{'='*50}\n⏹️⏹️⏹️ [bold blue]STOPPING[/bold blue] Photo Capture due to DigiCamCtrl command.\n{'='*50}\n")
-                        console.print(f"\n\n{'='*50}\n🎉 [bold magenta]Mission Complete: 'DigiCamCtrl' detected.[/bold magenta]\n{'='*50}\n")
-
-                    elif "SetCamTrigDst" in message_text:
-                        if not gopro_is_ready:
-                            console.print("[yellow]MAVLink trigger detected, but GoPro is not ready.[/yellow]")
-                            continue
-
-                        # Toggle photo capture state
-                        take_photos = not take_photos
-                        match = re.search(r"Mission: (\d+) SetCamTrigDst", message_text)
-                        waypoint_num = match.group(1) if match else "N/A"
-
-                        if take_photos:
-                            console.print(f"\n\n{'='*50}\n▶️▶️▶️ [bold green]STARTING[/bold green] Photo Capture (Waypoint #{waypoint_num})!\n{'='*50}\n")
-                        else:
-                            console.print(f"\n\n{'='*50}\n⏹️⏹️⏹️ [bold red]STOPPING[/bold red] Photo Capture (Waypoint #{waypoint_num})!\n{'='*50}\n")
-                await asyncio.sleep(0.1)
+                # Drain everything pymavlink has buffered before going back to sleep
+                received = False
+                while (msg := master.recv_match(type="STATUSTEXT", blocking=False)) is not None:
+                    received = True
+                    raw = msg.text
+                    # Most STATUSTEXT is unrelated; skip it before allocating a stripped copy
+                    if "SetCamTrigDst" in raw or "DigiCamCtrl" in raw:
+                        handle_statustext(raw.strip(), state)
+                idle_delay = 0.001 if received else min(idle_delay * 2, 0.1)
+                await wait_for_mavlink_data(master, idle_delay)
         except Exception as e:
             console.print(f"[bold red]MAVLink connection error: {repr(e)}. Retrying in 10 seconds...[/bold red]")
             await asyncio.sleep(10)
@@ -200,15 +361,19 @@ async def main(args: argparse.Namespace):
     output_dir = Path("gopro_captures")
     output_dir.mkdir(parents=True, exist_ok=True)
 
+    state = CaptureState()
+
     try:
         await asyncio.gather(
-            mavlink_listener(args.connect),
-            gopro_controller(args, output_dir),
+            mavlink_listener(args.connect, state),
+            gopro_controller(args, output_dir, state),
         )
     except KeyboardInterrupt:
         console.print("\nExiting program by user command.")
     except Exception as e:
         console.print(f"\nAn unexpected error occurred: {repr(e)}")
+    finally:
+        await release_gopro()
 
 def entrypoint():
     """The main program entrypoint."""
@@ -245,7 +410,8 @@ def entrypoint():
             args.log = None
 
     try:
-        asyncio.run(main(args))
+        run = uvloop.run if UVLOOP_AVAILABLE else asyncio.run
+        run(main(args))
     except Exception as e:
         console.print(f"Failed to start asyncio event loop: {repr(e)}")
 
@@ -1,6 +1,9 @@
 import argparse
 import asyncio
+import contextvars
+import functools
 import re
+import socket
 from datetime import datetime
 from pathlib import Path
 
@@ -13,18 +16,61 @@ from open_gopro.models import constants, proto
 from open_gopro.util import add_cli_args_and_parse
 from open_gopro.util.logger import setup_logging
 
+try:
+    import uvloop
+    # uvloop.run only exists from 0.18; older installs (e.g. Debian bookworm's 0.17) use asyncio.run
+    UVLOOP_AVAILABLE = hasattr(uvloop, "run")
+except ImportError:
+    UVLOOP_AVAILABLE = False
+
 
 console = Console()
 
+# Compiled once; matched against every camera-trigger STATUSTEXT.
+TRIGGER_RE = re.compile(r"Mission: (\d+) SetCamTrigDst")
+# 4-digit file counter and extension at the end of a GoPro photo name, e.g. GOPR0042.JPG.
+# Videos are left out: GX010043.MP4 would otherwise read as 10043 and every prediction would be a video
+PHOTO_NUMBER_RE = re.compile(r"(\d{4})(\.(?:jpg|gpr))$", re.IGNORECASE)
+
+# Errors that mean the GoPro session itself is gone and has to be re-opened
+CONNECTION_ERRORS = (OSError, asyncio.TimeoutError)
+MAX_CAPTURE_FAILURES = 3
+
 # --- Shared state to control the photo-taking loop ---
-take_photos = False
+# Set while the mission wants photos; the controller awaits it instead of polling.
+photo_event = asyncio.Event()
 gopro_is_ready = False
 
 
+def predict_next_photo(filenames) -> str | None:
+    """Guesses the camera's next photo filename from the highest photo counter seen so far."""
+    best = None
+    for name in filenames:
+        match = PHOTO_NUMBER_RE.search(name)
+        if match and (best is None or int(match.group(1)) > int(best.group(1))):
+            best = match
+    if best is None:
+        return None
+    digits = best.group(1)
+    next_number = f"{int(digits) + 1:0{len(digits)}d}"
+    return best.string[:best.start(1)] + next_number + best.group(2)
+
+
+async def download_photo(gopro: GoProBase, camera_file: str, output_file: Path):
+    """Downloads one photo from the camera; run as a task so it overlaps the next capture."""
+    console.print(f"Downloading {camera_file} to {output_file.name}...")
+    await gopro.http_command.download_file(camera_file=camera_file, local_file=output_file)
+    console.print(f"✅ Success! File downloaded to {output_file.absolute()}")
+
+
 async def gopro_controller(args: argparse.Namespace, output_dir: Path):
     """Manages GoPro connection and takes photos when enabled."""
-    global take_photos, gopro_is_ready
+    global gopro_is_ready
     gopro: GoProBase | None = None
+    download_task: asyncio.Task | None = None
+    # Format the wall-clock time once; a counter keeps same-second shots from colliding
+    session_start = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    shot_index = 0
 
     # Outer loop to handle reconnections
     while True:
@@ -43,18 +89,21 @@ async def gopro_controller(args: argparse.Namespace, output_dir: Path):
                 console.print("✅ GoPro is in Photo Mode.")
                 gopro_is_ready = True
 
+                # Fetch the media list once, then only track filenames that appear after it
+                media_list_before = await gopro.http_command.get_media_list()
+                if not media_list_before.ok:
+                    raise RuntimeError("Could not get media list before capture.")
+                known_filenames = {f.filename for f in media_list_before.data.files}
+                expected_name = predict_next_photo(known_filenames)
+
                 # --- Photo-taking loop ---
+                capture_failures = 0
                 while True:
-                    if take_photos:
+                    # Sleep until the MAVLink listener starts a capture run
+                    await photo_event.wait()
+                    try:
                         console.print("\nCapturing a photo...")
 
-                        media_list_before = await gopro.http_command.get_media_list()
-                        if not media_list_before.ok:
-                            console.print("[red]Could not get media list before capture.[/red]")
-                            await asyncio.sleep(1)
-                            continue
-                        media_set_before = {f.filename for f in media_list_before.data.files}
-
                         # Take a photo
                         shutter_response = await gopro.http_command.set_shutter(
                             shutter=constants.Toggle.ENABLE
@@ -64,50 +113,104 @@ async def gopro_controller(args: argparse.Namespace, output_dir: Path):
                             await asyncio.sleep(3)
                             continue
 
-                        # Find the new photo by comparing media lists
+                        # Find the new photo by probing the expected filename, which is far
+                        # cheaper than pulling the whole media list
                         new_photo_name = None
-                        for _ in range(5):  # Retry 5 times
+                        # Poll fast at first and back off, giving up after 2.5 seconds
+                        loop = asyncio.get_running_loop()
+                        deadline = loop.time() + 2.5
+                        delay = 0.05
+                        while expected_name and loop.time() < deadline:
+                            await asyncio.sleep(delay)
+                            metadata_response = await gopro.http_command.get_media_metadata(
+                                path=expected_name
+                            )
+                            if metadata_response.ok:
+                                new_photo_name = expected_name
+                                break
+                            delay = min(delay * 1.6, 0.4)
+
+                        if not new_photo_name:
+                            # Numbering didn't match the guess; fall back to comparing media lists
                             media_list_after = await gopro.http_command.get_media_list()
                             if media_list_after.ok:
-                                media_set_after = {f.filename for f in media_list_after.data.files}
-                                new_photos = media_set_after.difference(media_set_before)
+                                new_photos = [
+                                    f.filename
+                                    for f in media_list_after.data.files
+                                    if f.filename not in known_filenames
+                                ]
+                                known_filenames.update(new_photos)
                                 if new_photos:
                                     new_photo_name = new_photos.pop()
-                                    break
-                            await asyncio.sleep(0.5)
 
                         if not new_photo_name:
                             console.print("[red]Could not find new photo after capture.[/red]")
                             continue
+                        known_filenames.add(new_photo_name)
+                        expected_name = predict_next_photo([new_photo_name])
 
-                        # MODIFIED: Generate filename using only a new timestamp and the file extension,
-                        # mirroring the logic from the video.py example.
-                        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+                        # Name the file from the session timestamp, a shot counter and the extension
+                        shot_index += 1
                         file_extension = Path(new_photo_name).suffix
-                        output_file = output_dir / f"{timestamp}{file_extension}"
-
-                        # Download the photo
-                        console.print(f"Downloading {new_photo_name} to {output_file.name}...")
-                        await gopro.http_command.download_file(
-                            camera_file=new_photo_name, local_file=output_file
+                        output_file = output_dir / f"{session_start}_{shot_index:05d}{file_extension}"
+
+                        # Let the previous download finish before starting this one, so transfers
+                        # overlap with the next capture but never pile up
+                        if download_task:
+                            # Clear it first so a failed download isn't awaited twice
+                            previous_download, download_task = download_task, None
+                            try:
+                                await previous_download
+                            except Exception as e:
+                                # The earlier photo is lost, but this one must still be downloaded
+                                console.print(f"[red]Previous download failed: {repr(e)}[/red]")
+                        download_task = asyncio.create_task(
+                            download_photo(gopro, new_photo_name, output_file)
                         )
-                        console.print(f"✅ Success! File downloaded to {output_file.absolute()}")
-
-                        await asyncio.sleep(3)
-                    else:
-                        await asyncio.sleep(0.5)
+                    except CONNECTION_ERRORS:
+                        raise
+                    except Exception as e:
+                        # A failed command doesn't mean the session is gone; retry before reconnecting
+                        capture_failures += 1
+                        if capture_failures >= MAX_CAPTURE_FAILURES:
+                            raise
+                        console.print(f"[yellow]Capture failed: {repr(e)}. Retrying ({capture_failures}/{MAX_CAPTURE_FAILURES})...[/yellow]")
+                        await asyncio.sleep(1)
+                        continue
+                    capture_failures = 0
+
+                    await asyncio.sleep(3)
 
         except Exception as e:
             console.print(f"[bold red]GoPro Error: {repr(e)}. Retrying in 10 seconds...[/bold red]")
             gopro_is_ready = False
+            if download_task:
+                download_task.cancel()
+                download_task = None
             if gopro:
                 await gopro.close()
             await asyncio.sleep(10)
 
 
+def disable_nagle(master):
+    """Turns off Nagle's algorithm on a TCP MAVLink link; serial links are left alone."""
+    try:
+        master.port.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except (AttributeError, OSError):
+        pass
+
+
+async def fast_to_thread(func, /, *args, **kwargs):
+    """Like asyncio.to_thread, but skips the context copy wrapper when there is nothing to carry."""
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, func, *args, **kwargs) if len(ctx) else functools.partial(func, *args, **kwargs)
+    return await loop.run_in_executor(None, call)
+
+
 async def mavlink_listener(connection_string: str):
     """Listens for MAVLink messages and toggles the photo-taking state."""
-    global take_photos, gopro_is_ready
+    global gopro_is_ready
 
     # Outer loop for handling MAVLink reconnections
     while True:
@@ -124,17 +227,22 @@ async def mavlink_listener(connection_string: str):
 
             master.wait_heartbeat()
             console.print(f"✅ MAVLink Heartbeat received from System ID: {master.target_system}")
+            # Don't let the kernel hold back small MAVLink frames on TCP links
+            disable_nagle(master)
 
             # --- MAVLink message listening loop ---
             while True:
-                msg = master.recv_match(type="STATUSTEXT", blocking=False)
+                # Block in a worker thread until a STATUSTEXT arrives instead of polling every 100 ms
+                msg = await fast_to_thread(
+                    master.recv_match, type="STATUSTEXT", blocking=True, timeout=1.0
+                )
                 if msg:
                     message_text = msg.text.strip()
 
                     # Check for mission completion command
                     if "DigiCamCtrl" in message_text:
-                        if take_photos:
-                            take_photos = False
+                        if photo_event.is_set():
+                            photo_event.clear()
                             console.print(f"\n\n{'='*50}\n⏹️⏹️⏹️ [bold blue]STOPPING[/bold blue] Photo Capture due to DigiCamCtrl command.\n{'='*50}\n")
                         console.print(f"\n\n{'='*50}\n🎉 [bold magenta]Mission Complete: 'DigiCamCtrl' detected.[/bold magenta]\n{'='*50}\n")
 
@@ -145,17 +253,18 @@ async def mavlink_listener(connection_string: str):
                             continue
 
                         # Toggle the photo-taking state
-                        take_photos = not take_photos
-                        match = re.search(r"Mission: (\d+) SetCamTrigDst", message_text)
+                        if photo_event.is_set():
+                            photo_event.clear()
+                        else:
+                            photo_event.set()
+                        match = TRIGGER_RE.search(message_text)
                         waypoint_num = match.group(1) if match else "N/A"
 
-                        if take_photos:
+                        if photo_event.is_set():
                             console.print(f"\n\n{'='*50}\n▶️▶️▶️ [bold green]STARTING[/bold green] Photo Capture (Waypoint #{waypoint_num})!\n{'='*50}\n")
                         else:
                             console.print(f"\n\n{'='*50}\n⏹️⏹️⏹️ [bold red]STOPPING[/bold red] Photo Capture (Waypoint #{waypoint_num})!\n{'='*50}\n")
 
-                await asyncio.sleep(0.1)
-
         except Exception as e:
             console.print(f"[bold red]MAVLink connection error: {repr(e)}. Retrying in 10 seconds...[/bold red]")
             await asyncio.sleep(10)
@@ -173,6 +282,10 @@ async def main(args: argparse.Namespace):
     # connection_string = "tcp:127.0.0.1:5762"
     connection_string = "/dev/ttyAMA0:57600"
 
+    # Run new tasks inline until they first block (Python 3.12+)
+    if hasattr(asyncio, "eager_task_factory"):
+        asyncio.get_running_loop().set_task_factory(asyncio.eager_task_factory)
+
     try:
         await asyncio.gather(
             mavlink_listener(connection_string),
@@ -198,7 +311,8 @@ def entrypoint():
     args = add_cli_args_and_parse(parser)
 
     try:
-        asyncio.run(main(args))
+        run = uvloop.run if UVLOOP_AVAILABLE else asyncio.run
+        run(main(args))
     except Exception as e:
         console.print(f"Failed to start asyncio event loop: {repr(e)}")
 
@@ -1,7 +1,7 @@
 import argparse
 import asyncio
 import re
-from datetime import datetime
+import time
 from pathlib import Path
 
 from pymavlink import mavutil
@@ -82,7 +82,7 @@ async def gopro_controller(args: argparse.Namespace, output_dir: Path):
 
                         # MODIFIED: Generate filename using only a new timestamp and the file extension,
                         # mirroring the logic from the video.py example.
-                        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+                        timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
                         file_extension = Path(new_photo_name).suffix
                         output_file = output_dir / f"{timestamp}{file_extension}"
 
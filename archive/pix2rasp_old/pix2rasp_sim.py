@@ -1,17 +1,46 @@
 import asyncio
 import re
-from datetime import datetime
+import time
 from pathlib import Path
 from types import SimpleNamespace
 
 from pymavlink import mavutil
 from rich.console import Console
 
+try:
+    import uvloop
+    # uvloop.run only exists from 0.18; older installs (e.g. Debian bookworm's 0.17) use asyncio.run
+    UVLOOP_AVAILABLE = hasattr(uvloop, "run")
+except ImportError:
+    UVLOOP_AVAILABLE = False
+
 console = Console()
 
+# Compiled once; matched against every camera-trigger STATUSTEXT.
+TRIGGER_RE = re.compile(r"Mission: (\d+) SetCamTrigDst")
+# High-rate telemetry the listener never reads
+UNWANTED_MESSAGE_IDS = (
+    mavutil.mavlink.MAVLINK_MSG_ID_ATTITUDE,
+    mavutil.mavlink.MAVLINK_MSG_ID_GLOBAL_POSITION_INT,
+    mavutil.mavlink.MAVLINK_MSG_ID_GPS_RAW_INT,
+    mavutil.mavlink.MAVLINK_MSG_ID_SYS_STATUS,
+    mavutil.mavlink.MAVLINK_MSG_ID_RC_CHANNELS,
+    mavutil.mavlink.MAVLINK_MSG_ID_VFR_HUD,
+)
+# GoPro photos end in a 4-digit file counter, e.g. GOPR0042.JPG; videos are left out because
+# a name like GX010043.MP4 would otherwise read as 10043 and outrank every later photo
+PHOTO_NUMBER_RE = re.compile(r"(\d{4})\.(?:jpg|gpr)$", re.IGNORECASE)
+
+def photo_number(filename: str) -> int:
+    """Returns the file counter in a GoPro photo filename, or -1 for anything else."""
+    match = PHOTO_NUMBER_RE.search(filename)
+    return int(match.group(1)) if match else -1
+
 # --- Shared state variable to control the photo-taking loop ---
-take_photos = False
-gopro_is_ready = False
+# Photo on/off changes from the MAVLink listener; the controller only acts on the latest one
+trigger_queue = asyncio.Queue(maxsize=16)
+# Set while the GoPro is connected and in photo mode
+gopro_ready = asyncio.Event()
 
 # =================================================================
 # SIMULATED GOPRO
@@ -20,7 +49,7 @@ gopro_is_ready = False
 class MockHttpCommand:
     """A mock of the GoPro's HTTP command object."""
     def __init__(self):
-        self._photo_taken = False
+        self._last_number = 1
 
     async def load_preset_group(self, group):
         console.print(f"[green](Simulated)[/green] Set preset group to {group}")
@@ -28,21 +57,18 @@ class MockHttpCommand:
 
     async def get_media_list(self):
         console.print("[green](Simulated)[/green] Getting media list")
-        if self._photo_taken:
-            self._photo_taken = False
-            # Simulate a new file appearing
-            return SimpleNamespace(data=SimpleNamespace(files=[SimpleNamespace(filename=f"GOPR{datetime.now().second:04d}.JPG")]))
-        return SimpleNamespace(data=SimpleNamespace(files=[SimpleNamespace(filename="GOPR0001.JPG")]))
+        # Like a real card, each shot gets the next sequence number
+        return SimpleNamespace(data=SimpleNamespace(files=[SimpleNamespace(filename=f"GOPR{self._last_number:04d}.JPG")]))
 
     async def set_shutter(self, shutter):
         console.print(f"[green](Simulated)[/green] Set shutter to {shutter}")
-        self._photo_taken = True
+        self._last_number += 1
         return SimpleNamespace(ok=True)
 
     async def download_file(self, camera_file, local_file):
         console.print(f"[green](Simulated)[/green] Downloading {camera_file} to {local_file}")
-        with open(local_file, "w") as f:
-            f.write(f"This is a simulated image of {camera_file}.\n")
+        # Write off the event loop, as a real download would not stall MAVLink polling
+        await asyncio.to_thread(Path(local_file).write_text, f"This is a simulated image of {camera_file}.\n")
         await asyncio.sleep(0.1)
 
 class MockGoPro:
@@ -67,95 +93,136 @@ class MockGoPro:
 
 async def gopro_controller(output_dir: Path):
     """Manages connection to the simulated GoPro and takes photos."""
-    global take_photos, gopro_is_ready
+    take_photos = False
     GoProDevice = MockGoPro
 
     while True:
         try:
             async with GoProDevice("Simulated") as gopro:
                 console.print("📸 GoPro Initialized!")
-                gopro_is_ready = True
+                gopro_ready.set()
                 console.print("✅ GoPro is in Photo Mode.")
 
+                # Get the media list once and remember the highest photo number on the card
+                media_list_before = await gopro.http_command.get_media_list()
+                max_seen = max((photo_number(f.filename) for f in media_list_before.data.files), default=-1)
+
                 while True:
-                    if take_photos:
-                        console.print("\nCapturing a photo...")
-                        media_list_before = await gopro.http_command.get_media_list()
-                        media_set_before = set(f.filename for f in media_list_before.data.files)
-
-                        shutter_command = 1
-                        assert (await gopro.http_command.set_shutter(shutter=shutter_command)).ok
-
-                        new_photos = set()
-                        for _ in range(5):  # Retry for 2.5 seconds
-                            await asyncio.sleep(0.5)
-                            media_list_after = await gopro.http_command.get_media_list()
-                            media_set_after = set(f.filename for f in media_list_after.data.files)
-                            new_photos = media_set_after.difference(media_set_before)
-                            if new_photos:
-                                break
-
-                        if not new_photos:
-                            console.print("[red]Could not find new photo after capture.[/red]")
-                            continue
+                    # Apply any queued on/off changes; only the most recent one matters
+                    while not trigger_queue.empty():
+                        take_photos = trigger_queue.get_nowait()
+                    if not take_photos:
+                        # Idle until the listener turns photo capture on
+                        take_photos = await trigger_queue.get()
+                        continue
 
-                        new_photo_name = new_photos.pop()
-                        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-                        output_file = output_dir / f"{timestamp}_{new_photo_name}"
+                    console.print("\nCapturing a photo...")
 
-                        console.print(f"Downloading {new_photo_name}...")
-                        await gopro.http_command.download_file(camera_file=new_photo_name, local_file=output_file)
-                        console.print(f"✅ Success! File downloaded to {output_file.absolute()}")
+                    shutter_command = 1
+                    assert (await gopro.http_command.set_shutter(shutter=shutter_command)).ok
 
-                        await asyncio.sleep(3)
-                    else:
+                    new_photo_name = None
+                    for _ in range(5):  # Retry for 2.5 seconds
                         await asyncio.sleep(0.5)
+                        media_list_after = await gopro.http_command.get_media_list()
+                        newest = max(media_list_after.data.files, key=lambda f: photo_number(f.filename), default=None)
+                        if newest and photo_number(newest.filename) > max_seen:
+                            new_photo_name = newest.filename
+                            max_seen = photo_number(new_photo_name)
+                            break
+
+                    if not new_photo_name:
+                        console.print("[red]Could not find new photo after capture.[/red]")
+                        continue
+
+                    timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
+                    output_file = output_dir / f"{timestamp}_{new_photo_name}"
+
+                    console.print(f"Downloading {new_photo_name}...")
+                    await gopro.http_command.download_file(camera_file=new_photo_name, local_file=output_file)
+                    console.print(f"✅ Success! File downloaded to {output_file.absolute()}")
+
+                    await asyncio.sleep(3)
         except Exception as e:
             console.print(f"[bold red]GoPro Controller Error: {repr(e)}. Retrying in 10 seconds...[/bold red]")
-            gopro_is_ready = False
+            gopro_ready.clear()
             await asyncio.sleep(10)
 
+def quiet_telemetry_streams(master):
+    """Stops periodic telemetry on this link; STATUSTEXT and heartbeats are still sent."""
+    master.mav.request_data_stream_send(
+        master.target_system,
+        master.target_component,
+        mavutil.mavlink.MAV_DATA_STREAM_ALL,
+        0,  # rate (Hz)
+        0,  # 0 = stop
+    )
+    # Newer firmware also streams messages by interval, so switch those off individually
+    for msg_id in UNWANTED_MESSAGE_IDS:
+        master.mav.command_long_send(
+            master.target_system,
+            master.target_component,
+            mavutil.mavlink.MAV_CMD_SET_MESSAGE_INTERVAL,
+            0,
+            msg_id,
+            -1,  # -1 = disable
+            0, 0, 0, 0, 0,
+        )
+
+def publish_trigger(take_photos: bool):
+    """Queues a photo on/off change, dropping the oldest one if the controller has fallen behind."""
+    if trigger_queue.full():
+        trigger_queue.get_nowait()
+    trigger_queue.put_nowait(take_photos)
+
 async def mavlink_listener(connection_string: str):
     """Listens for MAVLink messages and toggles the photo-taking state."""
-    global take_photos, gopro_is_ready
+    take_photos = False
 
     while True:
         try:
             master = None
             if connection_string.startswith('tcp:'):
                 console.print(f"📡 Connecting to MAVLink via TCP at {connection_string}...")
-                master = mavutil.mavlink_connection(connection_string)
+                master = await asyncio.to_thread(mavutil.mavlink_connection, connection_string)
             else:
                 device, baud_rate = connection_string.split(':')
                 console.print(f"📡 Connecting to MAVLink via Serial at {device} (Baud: {baud_rate})...")
-                master = mavutil.mavlink_connection(device, baud=int(baud_rate))
+                master = await asyncio.to_thread(mavutil.mavlink_connection, device, baud=int(baud_rate))
 
-            master.wait_heartbeat()
+            # Connecting and waiting for a heartbeat block, so keep them off the event loop
+            await asyncio.to_thread(master.wait_heartbeat)
             console.print(f"✅ MAVLink Heartbeat received from System ID: {master.target_system}")
+            # Only STATUSTEXT matters here, so don't pay to parse the rest of the telemetry
+            quiet_telemetry_streams(master)
 
             while True:
-                msg = master.recv_match(type="STATUSTEXT", blocking=False)
-                if msg:
+                # Drain every queued STATUSTEXT before sleeping so bursts aren't read one per tick
+                while msg := master.recv_match(type="STATUSTEXT", blocking=False):
                     message_text = msg.text.strip()
-                    if "DigiCamCtrl" in message_text:
+                    # ArduPilot reports mission items as "Mission: N <Command>", so the command is the last word
+                    keyword = message_text.rpartition(" ")[2]
+                    if keyword == "DigiCamCtrl":
                         if take_photos:
                             take_photos = False
+                            publish_trigger(take_photos)
                             console.print(f"\n\n{'='*50}\n⏹️⏹️⏹️ [bold blue]STOPPING[/bold blue] Photo Capture due to DigiCamCtrl command.\n{'='*50}\n")
                         console.print(f"\n\n{'='*50}\n🎉 [bold magenta]Mission Complete: 'DigiCamCtrl' detected.[/bold magenta]\n{'='*50}\n")
-                    elif "SetCamTrigDst" in message_text:
-                        if not gopro_is_ready:
+                    elif keyword == "SetCamTrigDst":
+                        if not gopro_ready.is_set():
                             console.print("[yellow]MAVLink trigger detected, but GoPro is not ready.[/yellow]")
                             continue
                         
                         take_photos = not take_photos
-                        match = re.search(r"Mission: (\d+) SetCamTrigDst", message_text)
+                        publish_trigger(take_photos)
+                        match = TRIGGER_RE.search(message_text)
                         waypoint_num = match.group(1) if match else "N/A"
 
                         if take_photos:
                             console.print(f"\n\n{'='*50}\n▶️▶️▶️ [bold green]STARTING[/bold green] Photo Capture (Waypoint #{waypoint_num})!\n{'='*50}\n")
                         else:
                             console.print(f"\n\n{'='*50}\n⏹️⏹️⏹️ [bold red]STOPPING[/bold red] Photo Capture (Waypoint #{waypoint_num})!\n{'='*50}\n")
-                await asyncio.sleep(0.1)
+                await asyncio.sleep(0.05)
         except Exception as e:
             console.print(f"[bold red]MAVLink connection error: {repr(e)}. Retrying in 10 seconds...[/bold red]")
             await asyncio.sleep(10)
@@ -181,6 +248,7 @@ async def main():
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        run = uvloop.run if UVLOOP_AVAILABLE else asyncio.run
+        run(main())
     except Exception as e:
         console.print(f"Failed to start asyncio event loop: {repr(e)}")
\ No newline at end of file
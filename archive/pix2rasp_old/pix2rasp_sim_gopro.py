@@ -1,7 +1,7 @@
 import argparse
 import asyncio
 import re
-from datetime import datetime
+import time
 from pathlib import Path
 
 from pymavlink import mavutil
@@ -13,17 +13,47 @@ from open_gopro.models import constants, proto
 from open_gopro.util import add_cli_args_and_parse
 from open_gopro.util.logger import setup_logging
 
+try:
+    import uvloop
+    # uvloop.run only exists from 0.18; older installs (e.g. Debian bookworm's 0.17) use asyncio.run
+    UVLOOP_AVAILABLE = hasattr(uvloop, "run")
+except ImportError:
+    UVLOOP_AVAILABLE = False
+
 
 console = Console()
 
+# Compiled once; matched against every camera-trigger STATUSTEXT.
+TRIGGER_RE = re.compile(r"Mission: (\d+) SetCamTrigDst")
+# High-rate telemetry the listener never reads
+UNWANTED_MESSAGE_IDS = (
+    mavutil.mavlink.MAVLINK_MSG_ID_ATTITUDE,
+    mavutil.mavlink.MAVLINK_MSG_ID_GLOBAL_POSITION_INT,
+    mavutil.mavlink.MAVLINK_MSG_ID_GPS_RAW_INT,
+    mavutil.mavlink.MAVLINK_MSG_ID_SYS_STATUS,
+    mavutil.mavlink.MAVLINK_MSG_ID_RC_CHANNELS,
+    mavutil.mavlink.MAVLINK_MSG_ID_VFR_HUD,
+)
+# GoPro photos end in a 4-digit file counter, e.g. GOPR0042.JPG; videos are left out because
+# a name like GX010043.MP4 would otherwise read as 10043 and outrank every later photo
+PHOTO_NUMBER_RE = re.compile(r"(\d{4})\.(?:jpg|gpr)$", re.IGNORECASE)
+
+
+def photo_number(filename: str) -> int:
+    """Returns the file counter in a GoPro photo filename, or -1 for anything else."""
+    match = PHOTO_NUMBER_RE.search(filename)
+    return int(match.group(1)) if match else -1
+
 # --- Shared state to control the photo-taking loop ---
-take_photos = False
-gopro_is_ready = False
+# Photo on/off changes from the MAVLink listener; the controller only acts on the latest one
+trigger_queue = asyncio.Queue(maxsize=16)
+# Set while the GoPro is connected and in photo mode
+gopro_ready = asyncio.Event()
 
 
 async def gopro_controller(args: argparse.Namespace, output_dir: Path):
     """Manages GoPro connection and takes photos when enabled."""
-    global take_photos, gopro_is_ready
+    take_photos = False
     gopro: GoProBase | None = None
 
     # Outer loop to handle reconnections
@@ -42,72 +72,103 @@ async def gopro_controller(args: argparse.Namespace, output_dir: Path):
                     raise RuntimeError("Failed to set GoPro to Photo Mode.")
                     
                 console.print("✅ GoPro is in Photo Mode.")
-                gopro_is_ready = True
+                gopro_ready.set()
+
+                # Get the media list once and remember the highest photo number on the card
+                media_list_before = await gopro.http_command.get_media_list()
+                if not media_list_before.ok:
+                    raise RuntimeError("Could not get media list before capture.")
+                max_seen = max((photo_number(f.filename) for f in media_list_before.data.files), default=-1)
 
                 # --- Photo-taking loop ---
                 while True:
-                    if take_photos:
-                        console.print("\nCapturing a photo...")
+                    # Apply any queued on/off changes; only the most recent one matters
+                    while not trigger_queue.empty():
+                        take_photos = trigger_queue.get_nowait()
+                    if not take_photos:
+                        # Idle until the listener turns photo capture on
+                        take_photos = await trigger_queue.get()
+                        continue
+
+                    console.print("\nCapturing a photo...")
                         
-                        # Get media list before capture
-                        media_list_before = await gopro.http_command.get_media_list()
-                        if not media_list_before.ok:
-                            console.print("[red]Could not get media list before capture.[/red]")
-                            await asyncio.sleep(1) # Wait before retrying
-                            continue
-                        media_set_before = {f.filename for f in media_list_before.data.files}
-
-                        # Take a photo
-                        shutter_response = await gopro.http_command.set_shutter(
-                            shutter=constants.Toggle.ENABLE
-                        )
-                        if not shutter_response.ok:
-                            console.print("[red]Failed to trigger shutter. Will try again.[/red]")
-                            await asyncio.sleep(3) # Wait before next attempt
-                            continue
+                    # Take a photo
+                    shutter_response = await gopro.http_command.set_shutter(
+                        shutter=constants.Toggle.ENABLE
+                    )
+                    if not shutter_response.ok:
+                        console.print("[red]Failed to trigger shutter. Will try again.[/red]")
+                        await asyncio.sleep(3) # Wait before next attempt
+                        continue
+
+                    # Find the new photo by looking for a number past max_seen, with retries
+                    new_photo_name = None
+                    for _ in range(5):  # Retry 5 times
+                        media_list_after = await gopro.http_command.get_media_list()
+                        if media_list_after.ok:
+                            newest = max(media_list_after.data.files, key=lambda f: photo_number(f.filename), default=None)
+                            if newest and photo_number(newest.filename) > max_seen:
+                                new_photo_name = newest.filename
+                                max_seen = photo_number(new_photo_name)
+                                break
+                        await asyncio.sleep(0.5)
 
-                        # Find the new photo by comparing media lists, with retries
-                        new_photo_name = None
-                        for _ in range(5):  # Retry 5 times
-                            media_list_after = await gopro.http_command.get_media_list()
-                            if media_list_after.ok:
-                                media_set_after = {f.filename for f in media_list_after.data.files}
-                                new_photos = media_set_after.difference(media_set_before)
-                                if new_photos:
-                                    new_photo_name = new_photos.pop()
-                                    break
-                            await asyncio.sleep(0.5)
-
-                        if not new_photo_name:
-                            console.print("[red]Could not find new photo after capture.[/red]")
-                            continue
+                    if not new_photo_name:
+                        console.print("[red]Could not find new photo after capture.[/red]")
+                        continue
 
-                        # Download the photo
-                        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-                        output_file = output_dir / f"{timestamp}_{new_photo_name}"
-                        console.print(f"Downloading {new_photo_name}...")
-                        await gopro.http_command.download_file(
-                            camera_file=new_photo_name, local_file=output_file
-                        )
-                        console.print(f"✅ Success! File downloaded to {output_file.absolute()}")
-
-                        # Wait before the next shot
-                        await asyncio.sleep(3)
-                    else:
-                        # If not taking photos, wait briefly to avoid a busy loop
-                        await asyncio.sleep(0.5)
+                    # Download the photo
+                    timestamp = time.strftime("%Y-%m-%d_%H-%M-%S")
+                    output_file = output_dir / f"{timestamp}_{new_photo_name}"
+                    console.print(f"Downloading {new_photo_name}...")
+                    await gopro.http_command.download_file(
+                        camera_file=new_photo_name, local_file=output_file
+                    )
+                    console.print(f"✅ Success! File downloaded to {output_file.absolute()}")
+
+                    # Wait before the next shot
+                    await asyncio.sleep(3)
 
         except Exception as e:
             console.print(f"[bold red]GoPro Error: {repr(e)}. Retrying in 10 seconds...[/bold red]")
-            gopro_is_ready = False
+            gopro_ready.clear()
             if gopro:
                 await gopro.close()
             await asyncio.sleep(10)
 
 
+def quiet_telemetry_streams(master):
+    """Stops periodic telemetry on this link; STATUSTEXT and heartbeats are still sent."""
+    master.mav.request_data_stream_send(
+        master.target_system,
+        master.target_component,
+        mavutil.mavlink.MAV_DATA_STREAM_ALL,
+        0,  # rate (Hz)
+        0,  # 0 = stop
+    )
+    # Newer firmware also streams messages by interval, so switch those off individually
+    for msg_id in UNWANTED_MESSAGE_IDS:
+        master.mav.command_long_send(
+            master.target_system,
+            master.target_component,
+            mavutil.mavlink.MAV_CMD_SET_MESSAGE_INTERVAL,
+            0,
+            msg_id,
+            -1,  # -1 = disable
+            0, 0, 0, 0, 0,
+        )
+
+
+def publish_trigger(take_photos: bool):
+    """Queues a photo on/off change, dropping the oldest one if the controller has fallen behind."""
+    if trigger_queue.full():
+        trigger_queue.get_nowait()
+    trigger_queue.put_nowait(take_photos)
+
+
 async def mavlink_listener(connection_string: str):
     """Listens for MAVLink messages and toggles the photo-taking state."""
-    global take_photos, gopro_is_ready
+    take_photos = False
 
     # Outer loop for handling MAVLink reconnections
     while True:
@@ -116,39 +177,46 @@ async def mavlink_listener(connection_string: str):
             master = None
             if connection_string.startswith('tcp:'):
                 console.print(f"📡 Connecting to MAVLink via TCP at {connection_string}...")
-                master = mavutil.mavlink_connection(connection_string)
+                master = await asyncio.to_thread(mavutil.mavlink_connection, connection_string)
             else:
                 device, baud_rate = connection_string.split(':')
                 console.print(f"📡 Connecting to MAVLink via Serial at {device} (Baud: {baud_rate})...")
-                master = mavutil.mavlink_connection(device, baud=int(baud_rate))
+                master = await asyncio.to_thread(mavutil.mavlink_connection, device, baud=int(baud_rate))
                 
-            master.wait_heartbeat()
+            # Connecting and waiting for a heartbeat block, so keep them off the event loop
+            await asyncio.to_thread(master.wait_heartbeat)
             console.print(f"✅ MAVLink Heartbeat received from System ID: {master.target_system}")
+            # Only STATUSTEXT matters here, so don't pay to parse the rest of the telemetry
+            quiet_telemetry_streams(master)
 
             # --- MAVLink message listening loop ---
             while True:
-                msg = master.recv_match(type="STATUSTEXT", blocking=False)
-                if msg:
+                # Drain every queued STATUSTEXT before sleeping so bursts aren't read one per tick
+                while msg := master.recv_match(type="STATUSTEXT", blocking=False):
                     message_text = msg.text.strip()
+                    # ArduPilot reports mission items as "Mission: N <Command>", so the command is the last word
+                    keyword = message_text.rpartition(" ")[2]
                     
                     # Check for mission completion command
-                    if "DigiCamCtrl" in message_text:
+                    if keyword == "DigiCamCtrl":
                         if take_photos:
                             take_photos = False
+                            publish_trigger(take_photos)
                             console.print(f"\n\n{'='*50}\n⏹️⏹️⏹️ [bold blue]STOPPING[/bold blue] Photo Capture due to DigiCamCtrl command.\n{'='*50}\n")
                         console.print(f"\n\n{'='*50}\n🎉 [bold magenta]Mission Complete: 'DigiCamCtrl' detected.[/bold magenta]\n{'='*50}\n")
 
                     # Check for the camera trigger command
-                    elif "SetCamTrigDst" in message_text:
+                    elif keyword == "SetCamTrigDst":
                         # Ensure GoPro is ready before toggling
-                        if not gopro_is_ready:
+                        if not gopro_ready.is_set():
                             console.print("[yellow]MAVLink trigger detected, but GoPro is not ready. Please wait.[/yellow]")
                             continue
 
                         # Toggle the photo-taking state
                         take_photos = not take_photos
+                        publish_trigger(take_photos)
                         
-                        match = re.search(r"Mission: (\d+) SetCamTrigDst", message_text)
+                        match = TRIGGER_RE.search(message_text)
                         waypoint_num = match.group(1) if match else "N/A"
 
                         if take_photos:
@@ -165,7 +233,7 @@ async def mavlink_listener(connection_string: str):
                             )
 
                 # Yield control to the event loop
-                await asyncio.sleep(0.1)
+                await asyncio.sleep(0.05)
 
         except Exception as e:
             console.print(f"[bold red]MAVLink connection error: {repr(e)}. Retrying in 10 seconds...[/bold red]")
@@ -211,7 +279,8 @@ def entrypoint():
     args = add_cli_args_and_parse(parser)
 
     try:
-        asyncio.run(main(args))
+        run = uvloop.run if UVLOOP_AVAILABLE else asyncio.run
+        run(main(args))
     except Exception as e:
         console.print(f"Failed to start asyncio event loop: {repr(e)}")
 
@@ -4,7 +4,9 @@ import os
 folder_path = "client/gopro_captures" 
 
 
-# Count only files ending with .jpg or .JPG
-jpg_files = [f for f in os.listdir(folder_path) if f.lower().endswith('.jpg')]
+# Count only files ending with .jpg, in any letter case
+# scandir reports the entry type from the directory read itself, so no per-file stat is needed
+with os.scandir(folder_path) as entries:
+    jpg_count = sum(1 for entry in entries if entry.is_file() and entry.name.lower().endswith('.jpg'))
 
-print(f"Number of .JPG files: {len(jpg_files)}")
+print(f"Number of .JPG files: {jpg_count}")
@@ -1,7 +1,10 @@
 from PIL import Image
-from PIL.ExifTags import TAGS
+from concurrent.futures import ProcessPoolExecutor
 import os
 
+# The EXIF tag for GPS information is 34853 ("GPSInfo")
+GPS_TAG_ID = 34853
+
 def has_geotag(image_path: str) -> bool:
     """
     Checks if an image file contains GPS geotag data in its EXIF metadata.
@@ -13,7 +16,10 @@ def has_geotag(image_path: str) -> bool:
         True if the image has GPS data, False otherwise.
     """
     try:
-        image = Image.open(image_path)
+        # Image.open only parses the headers, and getexif() reads just the EXIF
+        # segment without expanding every sub-IFD the way _getexif() does
+        with Image.open(image_path) as image:
+            exif_data = image.getexif()
     except FileNotFoundError:
         print(f"Error: The file '{image_path}' was not found.")
         return False
@@ -21,23 +27,27 @@ def has_geotag(image_path: str) -> bool:
         print(f"Error opening or reading image: {e}")
         return False
 
-    # Extract EXIF data from the image
-    exif_data = image._getexif()
+    # The presence of the GPSInfo tag means it's geotagged
+    return GPS_TAG_ID in exif_data
 
-    # If there's no EXIF data, there's no geotag
-    if not exif_data:
-        return False
 
-    # The EXIF tag for GPS information is 34853
-    # We check if this key exists in the EXIF data
-    for tag_id, value in exif_data.items():
-        tag_name = TAGS.get(tag_id, tag_id)
-        if tag_name == "GPSInfo":
-            # The presence of the GPSInfo tag means it's geotagged
-            return True
+def scan_directory(directory: str, workers: int | None = None) -> dict[str, bool]:
+    """
+    Checks every JPG in a directory for GPS geotag data in parallel.
+
+    Args:
+        directory: The folder containing the images.
+        workers: Number of worker processes (defaults to the CPU count).
+
+    Returns:
+        A mapping of image path to whether it has GPS data.
+    """
+    with os.scandir(directory) as it:
+        paths = [entry.path for entry in it if entry.name.lower().endswith('.jpg')]
 
-    # If the loop finishes without finding the GPSInfo tag
-    return False
+    # Chunking keeps the per-image pickling overhead small for large folders
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(paths, executor.map(has_geotag, paths, chunksize=32)))
 
 
 if __name__ == "__main__":
@@ -48,7 +58,14 @@ if __name__ == "__main__":
     image_filename = "GOPR0318.JPG" # <--- CHANGE THIS
     # image_filename = "DJI_0620.JPG"
 
-    if not os.path.exists(image_filename):
+    # A folder (e.g. server/datasets/project/images) is scanned in parallel
+    if os.path.isdir(image_filename):
+        results = scan_directory(image_filename)
+        missing = [path for path, tagged in results.items() if not tagged]
+        print(f"📍 {len(results) - len(missing)} of {len(results)} images contain geotag data.")
+        for path in missing:
+            print(f"❌ {path}")
+    elif not os.path.exists(image_filename):
          print(f"❌ The file '{image_filename}' does not exist in this directory.")
     else:
         if has_geotag(image_filename):
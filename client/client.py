@@ -1,8 +1,17 @@
 import socket
+import collections
 import os
 import time
 import queue
 import threading
+import sys
+import select
+import struct
+import ctypes
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, wait
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
@@ -10,69 +19,268 @@ HOST = '172.232.231.100'  # The server's hostname or IP address
 PORT = 65432        # The port used by the server
 GOPRO_CAPTURES_DIR = 'gopro_captures'
 FLAG_FILE_EXTENSION = "flag"
+UPLOAD_QUEUE_SIZE = 64 # Pending uploads before the file watcher starts waiting
+ENQUEUE_TIMEOUT = 5.0 # Seconds the file watcher waits for room before holding an image back
+# Matched against os.path.splitext suffixes, so they keep the leading dot
+IMAGE_SUFFIXES = frozenset({'.jpg', '.jpeg', '.png', '.gif', '.bmp'})
+FLAG_SUFFIX = '.' + FLAG_FILE_EXTENSION
+# inotify reports when a writer closes a file, so on Linux files are queued only once complete
+QUEUE_ON_CLOSE = sys.platform.startswith('linux')
+MAX_RETRY_DELAY = 30 # Upper bound in seconds for the reconnect backoff
+SOCKET_TIMEOUT = 10 # Seconds a connect or send may stall before the connection is dropped
+UPLOAD_WORKERS = 4 # Parallel uploads, each over its own persistent connection
+# Marks the header as having more data to follow; 0 where the flag isn't available
+MSG_MORE = getattr(socket, 'MSG_MORE', 0)
+# inotify(7) constants; only files finished by their writer or moved in whole are reported
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_ISDIR = 0x40000000
+INOTIFY_EVENT = struct.Struct('iIII') # wd, mask, cookie, len, then a NUL-padded name
+# Upload frame length prefixes, big-endian: 4 bytes for the extension, 8 for the file
+EXT_LEN = struct.Struct('>I')
+FILE_LEN = struct.Struct('>Q')
+# The server answers each saved file with this byte; until it arrives the upload may still be lost
+ACK = b'\x06'
+ACK_TIMEOUT = 60 # Seconds to wait for the ack, which also covers whatever is still in the send buffer
+# Optional lossless JPEG optimizer; uploads go out unchanged if it isn't installed
+JPEGTRAN = shutil.which('jpegtran')
+MIN_OPTIMIZE_SIZE = 64 * 1024 # Smaller files aren't worth a subprocess
+# Names already uploaded but not yet deleted with their mission, so a restart doesn't send them again
+SENT_LIST_FILE = GOPRO_CAPTURES_DIR + '.sent'
 
-def uploader_worker(upload_queue):
+# Paths queued but not yet uploaded, so each file is sent once
+queued_paths = set()
+queued_paths_lock = threading.Lock()
+# Mirror of SENT_LIST_FILE, guarded by queued_paths_lock
+sent_names = set()
+# Images that found the upload queue full; queued again ahead of the next file, and always before a flag
+deferred_paths = collections.deque()
+
+def load_sent_list():
+    """Reads the names recorded as uploaded before the last restart."""
+    try:
+        with open(SENT_LIST_FILE) as f:
+            sent_names.update(line.rstrip('\n') for line in f if line.strip())
+    except FileNotFoundError:
+        pass
+
+def mark_sent(filepath):
+    """Records a file the server has confirmed, so neither the sweep nor the watcher queues it again."""
+    name = os.path.basename(filepath)
+    with queued_paths_lock:
+        sent_names.add(name)
+        try:
+            with open(SENT_LIST_FILE, 'a') as f:
+                f.write(name + '\n')
+        except OSError as e:
+            print(f"❗️ Could not record {name} as sent: {e}")
+
+def sent_paths():
+    """Returns every uploaded file not yet deleted, which is the whole current mission once its flag is sent."""
+    with queued_paths_lock:
+        return [os.path.join(GOPRO_CAPTURES_DIR, name) for name in sent_names]
+
+def forget_sent(filepaths):
+    """Drops deleted files from the sent list so it only ever holds the current mission."""
+    with queued_paths_lock:
+        sent_names.difference_update(os.path.basename(path) for path in filepaths)
+        try:
+            with open(SENT_LIST_FILE, 'w') as f:
+                f.writelines(name + '\n' for name in sent_names)
+        except OSError as e:
+            print(f"❗️ Could not update {SENT_LIST_FILE}: {e}")
+
+def connect_to_server():
+    """Opens an upload connection that is kept in the pool and reused for many files."""
+    s = socket.create_connection((HOST, PORT), timeout=SOCKET_TIMEOUT)
+    # Send each small header frame right away instead of waiting to coalesce
+    s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    # Idle pooled connections can sit for a whole flight; let the kernel notice if the server vanished
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    return s
+
+def wait_for_stable_size(filepath, interval=0.05, max_wait=1.0):
+    """Waits until a file stops growing, for platforms that can't report when a writer closes it."""
+    deadline = time.monotonic() + max_wait
+    size = os.path.getsize(filepath)
+    while time.monotonic() < deadline:
+        time.sleep(interval)
+        new_size = os.path.getsize(filepath)
+        if new_size == size:
+            return
+        size = new_size
+
+def optimize_jpeg(filepath):
     """
-    Pulls filepaths from a queue and sends them to the server.
-    Retries indefinitely on connection failure.
-    Deletes image files and the flag file after successful transmission of a flag file.
+    Writes a copy of a JPEG with optimized Huffman tables to the temp directory, outside the watched folder.
+    The transcode is lossless and keeps all EXIF, including the GPS tags the mapping run needs.
+    Returns the copy's path if it is smaller, otherwise None; the capture itself is never modified.
     """
-    time.sleep(2)
-    files_in_current_mission = [] # Stores paths of files successfully sent in the current mission batch
+    fd, tmp_path = tempfile.mkstemp(suffix='.jpg')
+    os.close(fd)
+    try:
+        if not QUEUE_ON_CLOSE:
+            wait_for_stable_size(filepath)
+        if os.path.getsize(filepath) < MIN_OPTIMIZE_SIZE:
+            return None
+        subprocess.run(
+            [JPEGTRAN, '-copy', 'all', '-optimize', '-outfile', tmp_path, filepath],
+            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        if os.path.getsize(tmp_path) < os.path.getsize(filepath):
+            optimized_path, tmp_path = tmp_path, None
+            return optimized_path
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"❗️ Could not optimize {os.path.basename(filepath)}: {e}. Sending it as is.")
+    finally:
+        if tmp_path is not None:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+    return None
 
-    while True:
-        filepath = upload_queue.get()
-        if filepath is None:  # Sentinel value to signal thread termination
-            break
+def send_file(filepath, connection_pool):
+    """
+    Sends one file to the server over a connection borrowed from the pool.
+    Reconnects with exponential backoff on failure and retries the file indefinitely.
+    Returns True once the server has acknowledged saving the file, or False if it disappeared first.
+    """
+    filename = os.path.basename(filepath)
+    file_ext = filename.split('.')[-1].lower() # Ensure extension is lowercase for consistent comparison
+    retry_delay = 1
+    optimized_path = None
+    if JPEGTRAN and file_ext in ('jpg', 'jpeg'):
+        optimized_path = optimize_jpeg(filepath)
+    s = connection_pool.get()
 
-        filename = os.path.basename(filepath)
-        file_ext = filename.split('.')[-1].lower() # Ensure extension is lowercase for consistent comparison
-        
-        sent_successfully = False
-        while not sent_successfully:
+    try:
+        while True:
             try:
-                time.sleep(1) 
-                
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                    s.settimeout(10) 
+                if optimized_path is None and not QUEUE_ON_CLOSE:
+                    wait_for_stable_size(filepath)
+
+                # Open the file before touching the socket so a missing file can't break the stream framing
+                with open(optimized_path or filepath, 'rb') as f:
+                    file_size = os.fstat(f.fileno()).st_size
+
+                    if s is None:
+                        s = connect_to_server()
                     print(f"Attempting to send {filename}...")
-                    s.connect((HOST, PORT))
-                    
+
+                    # Each file is framed as [ext_len][ext][file_len][file bytes]
                     ext_bytes = file_ext.encode('utf-8')
-                    s.sendall(len(ext_bytes).to_bytes(4, 'big'))
-                    s.sendall(ext_bytes)
-
-                    with open(filepath, 'rb') as f:
-                        s.sendall(f.read())
-
-                    print(f"✅ Successfully sent {filename} to server.")
-                    sent_successfully = True
-
-                    # Add to mission list if successfully sent
-                    files_in_current_mission.append(filepath)
-
-                    # If a flag file was just sent, trigger batch deletion
-                    if file_ext == FLAG_FILE_EXTENSION:
-                        print(f"🚩 Flag file {filename} sent. Initiating deletion of mission files...")
-                        for file_to_delete in files_in_current_mission:
-                            try:
-                                os.remove(file_to_delete)
-                                print(f"🗑️ Deleted file: {os.path.basename(file_to_delete)}")
-                            except OSError as e:
-                                print(f"❗️ Error deleting {os.path.basename(file_to_delete)}: {e}")
-                        files_in_current_mission.clear() # Reset for the next mission
-
-            except ConnectionRefusedError:
-                print(f"❗️ Connection refused for {filename}. Retrying in 5 seconds...")
-                time.sleep(5)
+                    header = EXT_LEN.pack(len(ext_bytes)) + ext_bytes + FILE_LEN.pack(file_size)
+
+                    # Empty files such as the mission flag have no body to send
+                    if file_size:
+                        # MSG_MORE lets the header share full segments with the file body
+                        # without two extra setsockopt calls to cork and uncork the socket
+                        s.sendall(header, MSG_MORE)
+                        # Let the kernel copy the file straight to the socket (sendfile(2) on Linux)
+                        s.sendfile(f, 0, file_size)
+                    else:
+                        s.sendall(header)
+
+                # sendall only hands the bytes to the local kernel; a pooled connection the server
+                # already closed still accepts them, so wait for the server to confirm the file
+                s.settimeout(ACK_TIMEOUT)
+                ack = s.recv(len(ACK))
+                s.settimeout(SOCKET_TIMEOUT)
+                if ack != ACK:
+                    raise ConnectionError("server closed the connection before acknowledging the file")
+
+                mark_sent(filepath)
+                print(f"✅ Successfully sent {filename} to server.")
+                return True
+
             except FileNotFoundError:
                 print(f"❗️ File {filename} was not found. It might have been deleted externally. Skipping.")
-                break # Stop trying for this file
+                return False
             except Exception as e:
-                print(f"❗️ Error sending {filename}: {e}. Retrying in 5 seconds...")
-                time.sleep(5)
-        
-        upload_queue.task_done()
+                if isinstance(e, ConnectionRefusedError):
+                    print(f"❗️ Connection refused for {filename}. Retrying in {retry_delay} seconds...")
+                else:
+                    print(f"❗️ Error sending {filename}: {e}. Retrying in {retry_delay} seconds...")
+                # The stream may be mid-frame, so drop the connection and start a fresh one
+                if s is not None:
+                    s.close()
+                    s = None
+                time.sleep(retry_delay)
+                retry_delay = min(retry_delay * 2, MAX_RETRY_DELAY)
+    finally:
+        connection_pool.put(s)
+        if optimized_path is not None:
+            os.remove(optimized_path)
+        with queued_paths_lock:
+            queued_paths.discard(filepath)
+
+def deleter_worker(deletion_queue):
+    """Deletes each batch of uploaded mission files until it receives None."""
+    while (files_to_delete := deletion_queue.get()) is not None:
+        deleted = []
+        for file_to_delete in files_to_delete:
+            try:
+                os.remove(file_to_delete)
+                deleted.append(file_to_delete)
+                print(f"🗑️ Deleted file: {os.path.basename(file_to_delete)}")
+            except OSError as e:
+                print(f"❗️ Error deleting {os.path.basename(file_to_delete)}: {e}")
+        # A file that couldn't be deleted stays listed, so a restart still won't resend it
+        forget_sent(deleted)
+
+def uploader_worker(upload_queue):
+    """
+    Pulls filepaths from a queue and uploads them in parallel, one persistent connection per worker.
+    A flag file is only sent once the server has confirmed every image queued before it.
+    Deletes image files and the flag file after successful transmission of a flag file.
+    """
+    # Slots start empty (None) and are connected on first use
+    connection_pool = queue.LifoQueue()
+    for _ in range(UPLOAD_WORKERS):
+        connection_pool.put(None)
+    pending_uploads = set() # Every in-flight or finished image upload in the current mission
+    # The executor's own queue is unbounded, so only take a file off upload_queue once a worker is free;
+    # otherwise upload_queue never fills and the watcher gets no back-pressure
+    upload_slots = threading.BoundedSemaphore(UPLOAD_WORKERS)
+    # Mission files are removed on their own thread so the next mission's uploads aren't held up
+    deletion_queue = queue.SimpleQueue()
+    deleter_thread = threading.Thread(target=deleter_worker, args=(deletion_queue,))
+    deleter_thread.start()
+
+    with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+        while True:
+            filepath = upload_queue.get()
+            if filepath is None:  # Sentinel value to signal thread termination
+                break
+
+            filename = os.path.basename(filepath)
+            file_ext = filename.split('.')[-1].lower() # Ensure extension is lowercase for consistent comparison
+
+            if file_ext != FLAG_FILE_EXTENSION:
+                upload_slots.acquire()
+                future = executor.submit(send_file, filepath, connection_pool)
+                future.add_done_callback(lambda _: (upload_slots.release(), upload_queue.task_done()))
+                pending_uploads.add(future)
+                continue
+
+            # The server starts mapping once the flag arrives, so finish this mission's images first.
+            # Each upload only completes once the server has acked the file, so they are all saved by now
+            wait(pending_uploads)
+            if send_file(filepath, connection_pool):
+                print(f"🚩 Flag file {filename} sent. Initiating deletion of mission files...")
+                # The sent list also covers images uploaded before a restart, which never got a future here
+                deletion_queue.put(sent_paths())
+                pending_uploads.clear() # Reset for the next mission
+            upload_queue.task_done()
+
+    while not connection_pool.empty():
+        s = connection_pool.get_nowait()
+        if s is not None:
+            s.close()
+
+    deletion_queue.put(None)
+    deleter_thread.join()
 
 
 class ImageHandler(FileSystemEventHandler):
@@ -82,16 +290,112 @@ class ImageHandler(FileSystemEventHandler):
         self.upload_queue = upload_queue
 
     def on_created(self, event):
+        if not QUEUE_ON_CLOSE:
+            self.queue_file(event)
+
+    def on_closed(self, event):
+        # Fires once the writer has finished, so the upload never sees a partial file
+        self.queue_file(event)
+
+    def queue_file(self, event):
         if not event.is_directory:
-            filepath = event.src_path
-            filename = os.path.basename(filepath)
-            file_ext = filename.split('.')[-1].lower() # Ensure extension is lowercase
-            if file_ext in ['jpg', 'jpeg', 'png', 'gif', 'bmp']:
-                print(f"📥 Detected new image, adding to queue: {filename}")
-                self.upload_queue.put(filepath)
-            elif file_ext == FLAG_FILE_EXTENSION:
-                print(f"🚩 Detected mission completion flag, adding to queue: {filename}")
-                self.upload_queue.put(filepath)
+            queue_path(self.upload_queue, event.src_path)
+
+
+class InotifyWatcher(threading.Thread):
+    """
+    Watches a directory with inotify directly, waking only when a file is closed after
+    writing or moved in. Used on Linux in place of the watchdog Observer.
+    """
+    def __init__(self, upload_queue, directory):
+        super().__init__(daemon=True)
+        self.upload_queue = upload_queue
+        self.directory = directory
+        libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+        # Writing to this pipe wakes the select() so stop() doesn't have to wait for a file event
+        self.stop_read, self.stop_write = os.pipe()
+
+    def run(self):
+        try:
+            while True:
+                ready, _, _ = select.select([self.fd, self.stop_read], [], [])
+                if self.stop_read in ready:
+                    break
+                try:
+                    buffer = os.read(self.fd, 65536)
+                except BlockingIOError:
+                    continue
+                offset = 0
+                while offset < len(buffer):
+                    _, mask, _, name_len = INOTIFY_EVENT.unpack_from(buffer, offset)
+                    offset += INOTIFY_EVENT.size
+                    name = buffer[offset:offset + name_len].rstrip(b'\0')
+                    offset += name_len
+                    if name and not mask & IN_ISDIR:
+                        queue_path(self.upload_queue, os.path.join(self.directory, os.fsdecode(name)))
+        finally:
+            os.close(self.fd)
+            os.close(self.stop_read)
+            os.close(self.stop_write)
+
+    def stop(self):
+        os.write(self.stop_write, b'\0')
+
+
+def queue_path(upload_queue, filepath):
+    """Queues an image or mission flag for upload and ignores anything else."""
+    suffix = os.path.splitext(filepath)[1].lower() # Ensure extension is lowercase
+    if suffix in IMAGE_SUFFIXES:
+        print(f"📥 Detected new image, adding to queue: {os.path.basename(filepath)}")
+        enqueue(upload_queue, filepath)
+    elif suffix == FLAG_SUFFIX:
+        print(f"🚩 Detected mission completion flag, adding to queue: {os.path.basename(filepath)}")
+        enqueue(upload_queue, filepath)
+
+def enqueue(upload_queue, filepath):
+    # The startup sweep and the watcher can both report the same file, as can a file closed twice
+    with queued_paths_lock:
+        if filepath in queued_paths or os.path.basename(filepath) in sent_names:
+            return
+        queued_paths.add(filepath)
+    if os.path.splitext(filepath)[1].lower() == FLAG_SUFFIX:
+        # A dropped flag would leave its mission unmapped, so wait for room, after any images held back
+        while deferred_paths:
+            upload_queue.put(deferred_paths.popleft())
+        upload_queue.put(filepath)
+        return
+    requeue_deferred(upload_queue)
+    try:
+        upload_queue.put(filepath, timeout=ENQUEUE_TIMEOUT)
+    except queue.Full:
+        print(f"❗️ Upload queue is full. Holding back {os.path.basename(filepath)} to retry later.")
+        deferred_paths.append(filepath)
+
+def requeue_deferred(upload_queue):
+    """Moves images held back by a full queue into the upload queue while it has room."""
+    while deferred_paths:
+        try:
+            upload_queue.put_nowait(deferred_paths[0])
+        except queue.Full:
+            return
+        deferred_paths.popleft()
+
+def queue_existing_files(upload_queue):
+    """
+    Queues files left over from before the watcher started, oldest first so a flag follows its images.
+    Files recorded in the sent list were already uploaded and are skipped by enqueue.
+    """
+    with os.scandir(GOPRO_CAPTURES_DIR) as it:
+        entries = [entry for entry in it if entry.is_file()]
+    for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+        queue_path(upload_queue, entry.path)
 
 
 def start_client():
@@ -100,14 +404,24 @@ def start_client():
         os.makedirs(GOPRO_CAPTURES_DIR)
         print(f"Created GoPro captures directory: {GOPRO_CAPTURES_DIR}")
 
-    upload_queue = queue.Queue()
+    load_sent_list()
+    upload_queue = queue.Queue(maxsize=UPLOAD_QUEUE_SIZE)
     worker_thread = threading.Thread(target=uploader_worker, args=(upload_queue,))
     worker_thread.start()
 
-    event_handler = ImageHandler(upload_queue)
-    observer = Observer()
-    observer.schedule(event_handler, GOPRO_CAPTURES_DIR, recursive=False)
+    observer = None
+    if QUEUE_ON_CLOSE:
+        try:
+            observer = InotifyWatcher(upload_queue, GOPRO_CAPTURES_DIR)
+        except (OSError, AttributeError) as e:
+            print(f"❗️ inotify unavailable ({e}). Falling back to watchdog.")
+    if observer is None:
+        observer = Observer()
+        observer.schedule(ImageHandler(upload_queue), GOPRO_CAPTURES_DIR, recursive=False)
+    # Sweep only once the watcher is running (watchdog doesn't watch until start), so a file
+    # written in between isn't missed; enqueue ignores the ones reported twice
     observer.start()
+    queue_existing_files(upload_queue)
     
     print(f"Client monitoring {GOPRO_CAPTURES_DIR} for new images...")
     print("Press Ctrl+C to stop the client.")
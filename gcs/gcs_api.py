@@ -1,4 +1,5 @@
 import os
+import threading
 from flask import Flask, request, jsonify, send_from_directory
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
@@ -8,11 +9,17 @@ app = Flask(__name__)
 CORS(app) # Enable CORS for all routes
 
 RECEIVE_DIR = 'received_orthophotos' # Directory to save received orthophotos
+UPLOAD_BUFFER_SIZE = 1 << 20 # Orthophotos are large; copy them in 1 MiB chunks rather than 16 KiB
 if not os.path.exists(RECEIVE_DIR):
     os.makedirs(RECEIVE_DIR)
 
 console = Console()
 
+# The directory's mtime changes whenever an entry is added, removed or renamed,
+# so the listing only has to be rebuilt when it moves
+files_cache = {'mtime_ns': None, 'files': []}
+files_cache_lock = threading.Lock()
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     if 'file' not in request.files:
@@ -24,7 +31,7 @@ def upload_file():
         filename = secure_filename(file.filename)
         filepath = os.path.join(RECEIVE_DIR, filename)
         try:
-            file.save(filepath)
+            file.save(filepath, buffer_size=UPLOAD_BUFFER_SIZE)
             console.print(f"[bold green]API: Received and saved {filename}[/bold green]")
             return jsonify({"message": f"File {filename} uploaded successfully"}), 200
         except IOError as e:
@@ -38,7 +45,13 @@ def upload_file():
 @app.route('/files', methods=['GET'])
 def list_files():
     try:
-        files = [f for f in os.listdir(RECEIVE_DIR) if os.path.isfile(os.path.join(RECEIVE_DIR, f))]
+        with files_cache_lock:
+            mtime_ns = os.stat(RECEIVE_DIR).st_mtime_ns
+            if mtime_ns != files_cache['mtime_ns']:
+                with os.scandir(RECEIVE_DIR) as it:
+                    files_cache['files'] = [entry.name for entry in it if entry.is_file()]
+                files_cache['mtime_ns'] = mtime_ns
+            files = files_cache['files']
         return jsonify({"files": files}), 200
     except Exception as e:
         console.print(f"[bold red]API: Error listing files: {e}[/bold red]")
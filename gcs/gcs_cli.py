@@ -1,14 +1,46 @@
 import socket
 import threading
 import os
+import select
 from rich.console import Console
 
+try:
+    import fcntl # Used to enlarge the splice pipe; Linux only, like os.splice
+except ImportError:
+    fcntl = None
+
 HOST = '127.0.0.1'  # Standard loopback interface address (localhost)
 PORT = 65433        # Port to listen on for GCS (different from server.py)
 RECEIVE_DIR = 'received_orthophotos' # Directory to save received orthophotos
+RECV_CHUNK = 256 * 1024  # Bytes moved per splice/recv when saving a file
 
 console = Console()
 
+def splice_to_file(conn, f):
+    """Moves the rest of the stream into f through a pipe, so the bytes never enter Python."""
+    read_end, write_end = os.pipe()
+    try:
+        # A larger pipe lets each splice move more than the default 64 KiB
+        try:
+            chunk = fcntl.fcntl(write_end, fcntl.F_SETPIPE_SZ, RECV_CHUNK)
+        except OSError:
+            chunk = 65536
+        while True:
+            try:
+                n = os.splice(conn.fileno(), write_end, chunk)
+            except BlockingIOError:
+                # A socket with a timeout is non-blocking underneath, so wait for data here
+                if not select.select([conn], [], [], conn.gettimeout())[0]:
+                    raise socket.timeout("timed out")
+                continue
+            if not n:
+                return
+            while n:
+                n -= os.splice(read_end, f.fileno(), n)
+    finally:
+        os.close(read_end)
+        os.close(write_end)
+
 def handle_incoming_file(conn, addr):
     """Handles an individual incoming file connection."""
     console.print(f"[bold magenta]GCS: Connected by {addr}[/bold magenta]")
@@ -30,11 +62,14 @@ def handle_incoming_file(conn, addr):
         os.makedirs(os.path.dirname(filepath), exist_ok=True) # Ensure directory exists
 
         with open(filepath, 'wb') as f:
-            while True:
-                data = conn.recv(4096)
-                if not data:
-                    break
-                f.write(data)
+            if hasattr(os, 'splice'):
+                # Linux: zero-copy from the socket to the page cache
+                splice_to_file(conn, f)
+            else:
+                # Reuse one buffer rather than allocating a bytes object per chunk
+                buffer = memoryview(bytearray(RECV_CHUNK))
+                while n := conn.recv_into(buffer):
+                    f.write(buffer[:n])
         console.print(f"[bold green]GCS: Received and saved {file_name} from {addr}[/bold green]")
     except ConnectionResetError:
         console.print(f"GCS: Client {addr} forcefully closed the connection.")
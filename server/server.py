@@ -1,8 +1,9 @@
 import socket
 import threading
 import os
-import datetime
+import select
 import glob
+import itertools
 import time
 import subprocess # Import the subprocess module
 import shutil # Import shutil for directory operations
@@ -10,11 +11,18 @@ from rich.console import Console
 from flask import Flask, render_template_string, send_from_directory, abort, request, redirect, url_for
 from werkzeug.utils import secure_filename
 
+try:
+    import fcntl # Used to enlarge the splice pipe; Linux only, like os.splice
+except ImportError:
+    fcntl = None
+
 HOST = '0.0.0.0'  # Listen on all available interfaces for AWS compatibility
 PORT = 65432        # Port to listen on (non-privileged ports are > 1023)
 GCS_HOST = '127.0.0.1' # GCS Host
 GCS_PORT = 65433     # GCS Port (must match gcs.py)
 FLASK_PORT = 5000   # Port for the Flask web server
+RECV_CHUNK = 256 * 1024  # Bytes moved per splice/recv when saving a file
+ACK = b'\x06' # Sent back once a file is fully written, so the client knows it can delete its copy
 
 # Get the directory where the script is located
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -23,6 +31,12 @@ BROWSE_BASE_DIR = os.path.join(SCRIPT_DIR, 'datasets') # New base directory for
 MAPPING_SCRIPT_PATH = os.path.join(SCRIPT_DIR, 'mapping_script.sh')
 
 console = Console()
+# Set by handle_client when a flag file arrives; wakes monitor_flag_files
+flag_received = threading.Event()
+# Uploads are named from the server start time and a running count, which stays unique
+# when parallel connections finish within the same microsecond and sorts in arrival order
+UPLOAD_PREFIX = time.strftime('%Y%m%d_%H%M%S')
+upload_counter = itertools.count(1)
 app = Flask(__name__)
 
 # Inline HTML template for directory listing
@@ -135,35 +149,105 @@ def download_file(filename):
     except FileNotFoundError:
         abort(404)
 
+def recv_exact(conn, size):
+    """Reads exactly size bytes from conn, or returns None if the client disconnects first."""
+    chunks = []
+    while size:
+        data = conn.recv(min(size, 65536))
+        if not data:
+            return None
+        chunks.append(data)
+        size -= len(data)
+    return b''.join(chunks)
+
+def recv_into_file(conn, f, size):
+    """
+    Writes the next size bytes from conn into f and returns how many were still missing
+    when the client disconnected (0 if all arrived). On Linux the bytes are spliced
+    through a pipe so they never enter Python.
+    """
+    if not hasattr(os, 'splice'):
+        # Reuse one buffer rather than allocating a bytes object per chunk
+        buffer = memoryview(bytearray(RECV_CHUNK))
+        while size:
+            n = conn.recv_into(buffer, min(size, len(buffer)))
+            if not n:
+                break
+            f.write(buffer[:n])
+            size -= n
+        return size
+
+    read_end, write_end = os.pipe()
+    try:
+        # A larger pipe lets each splice move more than the default 64 KiB
+        try:
+            chunk = fcntl.fcntl(write_end, fcntl.F_SETPIPE_SZ, RECV_CHUNK)
+        except OSError:
+            chunk = 65536
+        while size:
+            try:
+                n = os.splice(conn.fileno(), write_end, min(size, chunk))
+            except BlockingIOError:
+                # A socket with a timeout is non-blocking underneath, so wait for data here
+                if not select.select([conn], [], [], conn.gettimeout())[0]:
+                    raise socket.timeout("timed out")
+                continue
+            if not n:
+                break
+            size -= n
+            while n:
+                n -= os.splice(read_end, f.fileno(), n)
+    finally:
+        os.close(read_end)
+        os.close(write_end)
+    return size
+
 def handle_client(conn, addr):
-    """Handles an individual client connection."""
+    """Handles a client connection, which stays open for any number of uploaded files."""
     console.print(f"Connected by {addr}")
-    conn.settimeout(10) # Set a timeout for client connection operations
+    # Keepalive lets us notice a client that vanished while the connection sat idle
+    conn.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
     try:
-        # Receive file extension first
-        file_ext_len_bytes = conn.recv(4)
-        if not file_ext_len_bytes:
-            console.print(f"Client {addr} disconnected before sending extension length.")
-            return
-        file_ext_len = int.from_bytes(file_ext_len_bytes, 'big')
-        file_ext = conn.recv(file_ext_len).decode('utf-8')
-
-        if not file_ext:
-            console.print(f"Client {addr} disconnected or sent empty extension.")
-            return
-
-        # Create a unique filename and save the file
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-        filename = f"image_{timestamp}.{file_ext}"
-        filepath = os.path.join(UPLOAD_DIR, filename)
-
-        with open(filepath, 'wb') as f:
-            while True:
-                data = conn.recv(4096)
-                if not data:
-                    break
-                f.write(data)
-        console.print(f"Received and saved {filename} from {addr}")
+        while True:
+            # Wait as long as it takes for the next file, then time out stalled transfers
+            conn.settimeout(None)
+            file_ext_len_bytes = recv_exact(conn, 4)
+            if not file_ext_len_bytes:
+                console.print(f"Client {addr} closed the connection.")
+                return
+            conn.settimeout(10)
+
+            # Each file is framed as [ext_len][ext][file_len][file bytes]
+            file_ext_len = int.from_bytes(file_ext_len_bytes, 'big')
+            file_ext_bytes = recv_exact(conn, file_ext_len)
+            file_len_bytes = recv_exact(conn, 8)
+            if not file_ext_bytes or not file_len_bytes:
+                console.print(f"Client {addr} disconnected or sent an incomplete header.")
+                return
+            file_ext = file_ext_bytes.decode('utf-8')
+            file_len = int.from_bytes(file_len_bytes, 'big')
+
+            # Create a unique filename and save the file
+            filename = f"image_{UPLOAD_PREFIX}_{next(upload_counter):06d}.{file_ext}"
+            filepath = os.path.join(UPLOAD_DIR, filename)
+
+            try:
+                with open(filepath, 'wb') as f:
+                    remaining = recv_into_file(conn, f, file_len)
+            except Exception:
+                # A stalled or dropped transfer must not leave a truncated image for the mapping run
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+                raise
+            if remaining:
+                # Don't leave a truncated image behind for the mapping run
+                os.remove(filepath)
+                console.print(f"Client {addr} disconnected partway through {filename}.")
+                return
+            console.print(f"Received and saved {filename} from {addr}")
+            conn.sendall(ACK)
+            if file_ext == 'flag':
+                flag_received.set()
     except ConnectionResetError:
         console.print(f"Client {addr} forcefully closed the connection.")
     except Exception as e:
@@ -173,73 +257,72 @@ def handle_client(conn, addr):
         console.print(f"Connection with {addr} closed.")
 
 def monitor_flag_files():
-    """Continuously monitors the UPLOAD_DIR for flag files."""
-    flag_detected = False
+    """Runs the mapping script each time handle_client saves a mission's flag file."""
     while True:
+        # Sleep until a flag arrives instead of re-globbing UPLOAD_DIR every second
+        flag_received.wait()
+        flag_received.clear()
         flag_files = glob.glob(os.path.join(UPLOAD_DIR, '*.flag'))
-        if flag_files and not flag_detected:
-            console.print("[bold green]Ready to make an orthophoto[/bold green]")
-            flag_detected = True
-            # Execute the mapping script
-            console.print(f"Executing mapping script: {MAPPING_SCRIPT_PATH}")
-            try:
-                # Use subprocess.run to execute the shell script
-                # Use subprocess.Popen to stream output in real-time
-                process = subprocess.Popen(
-                    [MAPPING_SCRIPT_PATH],
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True, # Decode stdout/stderr as text
-                    bufsize=1 # Line-buffered output
-                )
-
-                # Stream stdout
-                for line in process.stdout:
-                    console.print(f"[blue]SCRIPT OUT:[/blue] {line.strip()}")
-                # Stream stderr
-                for line in process.stderr:
-                    console.print(f"[red]SCRIPT ERR:[/red] {line.strip()}")
-
-                # Wait for the process to complete and get the return code
-                process.wait()
-
-                if process.returncode == 0:
-                    console.print("[bold green]Mapping script executed successfully![/bold green]")
-                    # After successful mapping, send orthophotos to GCS
-                    orthophoto_path = os.path.join(SCRIPT_DIR, 'datasets', 'project', 'odm_orthophoto', 'odm_orthophoto.tif')
-                    original_orthophoto_path = os.path.join(SCRIPT_DIR, 'datasets', 'project', 'odm_orthophoto', 'odm_orthophoto.original.tif')
-
-                    if os.path.exists(orthophoto_path):
-                        send_file_to_gcs(orthophoto_path, max_retries=3, retry_delay=5)
-                    else:
-                        console.print(f"[bold yellow]Warning: {orthophoto_path} not found. Skipping transfer.[/bold yellow]")
-
-                    if os.path.exists(original_orthophoto_path):
-                        send_file_to_gcs(original_orthophoto_path, max_retries=3, retry_delay=5)
-                    else:
-                        console.print(f"[bold yellow]Warning: {original_orthophoto_path} not found. Skipping transfer.[/bold yellow]")
-
-                    # Delete the datasets folder after sending files
-                    delete_datasets_folder()
+        if not flag_files:
+            continue
+        console.print("[bold green]Ready to make an orthophoto[/bold green]")
+        # Execute the mapping script
+        console.print(f"Executing mapping script: {MAPPING_SCRIPT_PATH}")
+        try:
+            # Use subprocess.run to execute the shell script
+            # Use subprocess.Popen to stream output in real-time
+            process = subprocess.Popen(
+                [MAPPING_SCRIPT_PATH],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True, # Decode stdout/stderr as text
+                bufsize=1 # Line-buffered output
+            )
+
+            # Stream stdout
+            for line in process.stdout:
+                console.print(f"[blue]SCRIPT OUT:[/blue] {line.strip()}")
+            # Stream stderr
+            for line in process.stderr:
+                console.print(f"[red]SCRIPT ERR:[/red] {line.strip()}")
+
+            # Wait for the process to complete and get the return code
+            process.wait()
+
+            if process.returncode == 0:
+                console.print("[bold green]Mapping script executed successfully![/bold green]")
+                # After successful mapping, send orthophotos to GCS
+                orthophoto_path = os.path.join(SCRIPT_DIR, 'datasets', 'project', 'odm_orthophoto', 'odm_orthophoto.tif')
+                original_orthophoto_path = os.path.join(SCRIPT_DIR, 'datasets', 'project', 'odm_orthophoto', 'odm_orthophoto.original.tif')
+
+                if os.path.exists(orthophoto_path):
+                    send_file_to_gcs(orthophoto_path, max_retries=3, retry_delay=5)
+                else:
+                    console.print(f"[bold yellow]Warning: {orthophoto_path} not found. Skipping transfer.[/bold yellow]")
 
+                if os.path.exists(original_orthophoto_path):
+                    send_file_to_gcs(original_orthophoto_path, max_retries=3, retry_delay=5)
                 else:
-                    console.print(f"[bold red]Mapping script exited with error code: {process.returncode}[/bold red]")
+                    console.print(f"[bold yellow]Warning: {original_orthophoto_path} not found. Skipping transfer.[/bold yellow]")
 
-            except FileNotFoundError:
-                console.print(f"[bold red]Mapping script not found at {MAPPING_SCRIPT_PATH}. Make sure it's executable.[/bold red]")
-            except Exception as e:
-                console.print(f"[bold red]An unexpected error occurred while running the mapping script: {e}[/bold red]")
+                # Delete the datasets folder after sending files
+                delete_datasets_folder()
 
-            # Delete the flag files after attempting to run the script
-            for flag_file in flag_files:
-                try:
-                    os.remove(flag_file)
-                    console.print(f"Deleted flag file: {flag_file}")
-                except OSError as e:
-                    console.print(f"Error deleting flag file {flag_file}: {e}")
-        elif not flag_files and flag_detected:
-            flag_detected = False # Reset if flag files are removed
-        time.sleep(1) # Prevent busy-waiting
+            else:
+                console.print(f"[bold red]Mapping script exited with error code: {process.returncode}[/bold red]")
+
+        except FileNotFoundError:
+            console.print(f"[bold red]Mapping script not found at {MAPPING_SCRIPT_PATH}. Make sure it's executable.[/bold red]")
+        except Exception as e:
+            console.print(f"[bold red]An unexpected error occurred while running the mapping script: {e}[/bold red]")
+
+        # Delete the flag files after attempting to run the script
+        for flag_file in flag_files:
+            try:
+                os.remove(flag_file)
+                console.print(f"Deleted flag file: {flag_file}")
+            except OSError as e:
+                console.print(f"Error deleting flag file {flag_file}: {e}")
 
 def send_file_to_gcs(filepath, max_retries=3, retry_delay=5):
     """Sends a file to the GCS receiver with retry mechanism."""
@@ -256,13 +339,10 @@ def send_file_to_gcs(filepath, max_retries=3, retry_delay=5):
                 s.sendall(len(file_name_bytes).to_bytes(4, 'big'))
                 s.sendall(file_name_bytes)
 
-                # Send file content
+                # Send file content; sendfile(2) copies it in the kernel, and elsewhere
+                # socket.sendfile falls back to small reads rather than buffering the whole file
                 with open(filepath, 'rb') as f:
-                    while True:
-                        bytes_read = f.read(4096)
-                        if not bytes_read:
-                            break
-                        s.sendall(bytes_read)
+                    s.sendfile(f)
             console.print(f"[bold green]Successfully sent {filename} to GCS.[/bold green]")
             return True # Successfully sent
         except ConnectionRefusedError:
@@ -305,6 +385,8 @@ def delete_datasets_folder():
 
 def start_server():
     """Starts the server and listens for incoming connections."""
+    # Check once at startup for a flag left behind before a restart
+    flag_received.set()
     # Start the flag monitoring thread
     flag_monitor_thread = threading.Thread(target=monitor_flag_files, daemon=True)
     flag_monitor_thread.start()